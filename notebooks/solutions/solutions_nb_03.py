@@ -31,14 +31,9 @@ mixture_density_net = mdn.MultivariateGaussianMDN(
 
 # Solution task 3.
 num_samples = 50_000
-samples = []
 
 # get the posterior, i.e. get the mixture components
 weights, means, variances = mixture_density_net.get_mixture_components(x_o.reshape(1, -1))
 
-for _ in trange(num_samples):
-    # sample form mixture of Gaussians
-    sample = mdn.mog_sample(weights, means, variances)
-    samples.append(sample)
-
-samples = torch.cat(samples).detach()
+# sample from the mixture of Gaussians, all samples at once
+samples = mdn.mog_sample(weights, means, variances, num_samples)[0].detach()
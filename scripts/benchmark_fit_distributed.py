@@ -0,0 +1,65 @@
+import os
+
+import click
+import torch
+import torch.nn as nn
+from tfl_training_sbi.mdn import MultivariateGaussianMDN
+from tfl_training_sbi.training import fit, fit_distributed
+from torch.utils.data import TensorDataset
+
+
+def make_mdn(context_features: int) -> MultivariateGaussianMDN:
+    return MultivariateGaussianMDN(
+        features=2,
+        hidden_net=nn.Sequential(
+            nn.Linear(context_features, 32), nn.ReLU(), nn.Linear(32, 32), nn.ReLU()
+        ),
+        num_components=5,
+        hidden_features=32,
+    )
+
+
+@click.command()
+@click.option("--num-samples", default=200_000, help="Size of the synthetic bank.")
+@click.option("--context-features", default=10, help="Dimension of x.")
+@click.option("--batch-size", default=256, help="Batch size per process.")
+@click.option("--epochs", default=2, help="Number of timed epochs.")
+@click.option(
+    "--max-processes", default=os.cpu_count(), help="Largest number of processes."
+)
+def benchmark(
+    num_samples: int,
+    context_features: int,
+    batch_size: int,
+    epochs: int,
+    max_processes: int,
+):
+    torch.manual_seed(0)
+    x = torch.rand(num_samples, context_features)
+    theta = x[:, :2] + 0.1 * torch.randn(num_samples, 2)
+    dataset = TensorDataset(theta, x)
+    kwargs = dict(batch_size=batch_size, max_epochs=epochs, progress=False)
+
+    num_processes, baseline = 1, None
+    while num_processes <= max_processes:
+        mdn = make_mdn(context_features)
+        if num_processes == 1:
+            history = fit(mdn, dataset, num_threads=1, **kwargs)
+        else:
+            history = fit_distributed(
+                mdn, dataset, num_processes=num_processes, **kwargs
+            )
+
+        # the first epoch includes the start of the processes
+        speed = max(history["samples_per_second"])
+        baseline = baseline or speed
+        click.echo(
+            f"{num_processes:>3} processes: {speed:10.0f} samples/s, "
+            f"speedup {speed / baseline:5.2f}, "
+            f"efficiency {speed / baseline / num_processes:5.1%}"
+        )
+        num_processes *= 2
+
+
+if __name__ == "__main__":
+    benchmark()
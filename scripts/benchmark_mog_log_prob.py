@@ -0,0 +1,62 @@
+import time
+
+import click
+import torch
+from tfl_training_sbi.mdn import (
+    compile_mog_log_prob,
+    mog_log_prob,
+    mog_log_prob_from_log_variances,
+)
+from torch.profiler import ProfilerActivity, profile
+
+
+def allocated_bytes(fn, *args) -> int:
+    """Total bytes allocated by the torch operators of a single call."""
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(*args)
+    return sum(max(event.self_cpu_memory_usage, 0) for event in prof.key_averages())
+
+
+def time_per_call(fn, *args, repeats: int) -> float:
+    for _ in range(3):
+        fn(*args)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+@click.command()
+@click.option("--batch-size", default=1024, help="Number of thetas per call.")
+@click.option("--features", default=2, help="Dimension of theta.")
+@click.option("--num-components", default=10, help="Number of mixture components.")
+@click.option("--repeats", default=200, help="Number of timed calls.")
+def benchmark(batch_size: int, features: int, num_components: int, repeats: int):
+    theta = torch.randn(batch_size, features)
+    logits = torch.log_softmax(torch.randn(batch_size, num_components), dim=-1)
+    means = torch.randn(batch_size, num_components, features)
+    log_variances = torch.randn(batch_size, num_components, features)
+
+    kernels = {
+        "mog_log_prob": lambda: mog_log_prob(
+            theta, logits, means, torch.exp(log_variances)
+        ),
+        "log-space": lambda: mog_log_prob_from_log_variances(
+            theta, logits, means, log_variances
+        ),
+    }
+    scripted = compile_mog_log_prob("script")
+    kernels["log-space, TorchScript"] = lambda: scripted(
+        theta, logits, means, log_variances
+    )
+
+    for name, kernel in kernels.items():
+        seconds = time_per_call(kernel, repeats=repeats)
+        click.echo(
+            f"{name:>24}: {seconds * 1e6:8.1f} us/call, "
+            f"{allocated_bytes(kernel) / 1024:8.1f} KiB allocated/call"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,135 @@
+"""Asynchronous front-end for latency-bound simulators."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Set, Tuple
+
+import torch
+from torch import Tensor
+
+
+class AsyncSimulator:
+    """Run a latency-bound simulator concurrently from asyncio code."""
+
+    def __init__(
+        self,
+        simulator: Callable[[int], Tuple[Tensor, Tensor]],
+        max_concurrency: int = 8,
+        max_batch_size: int = 1024,
+        max_delay: float = 0.005,
+    ):
+        """Run a latency-bound simulator concurrently from asyncio code.
+
+        Requests made with `simulate` are not sent to the simulator one by
+        one. They are collected for at most `max_delay` seconds or until
+        `max_batch_size` samples are pending and then coalesced into a single
+        simulator call, which pays the latency only once. Up to
+        `max_concurrency` of these calls run at the same time in a thread pool,
+        so throughput scales with concurrency instead of with 1 / latency.
+
+        Args:
+            simulator (callable): Simulator that takes the number of samples
+            and returns theta and x, e.g. a `SIRSimulation`.
+            max_concurrency (int, optional): Maximal number of simulator calls
+            in flight. Defaults to 8.
+            max_batch_size (int, optional): Number of pending samples that
+            triggers a simulator call without waiting. Defaults to 1024.
+            max_delay (float, optional): Maximal time in seconds a request waits
+            for others to be coalesced with. Defaults to 0.005.
+        """
+        self.simulator = simulator
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._pending: List[Tuple[int, asyncio.Future]] = []
+        self._pending_samples = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # keep references to running batches, otherwise they may be collected
+        self._batches: Set[asyncio.Task] = set()
+
+    async def simulate(self, num_samples: int = 1) -> Tuple[Tensor, Tensor]:
+        """Sample from the simulator.
+
+        Args:
+            num_samples (int, optional): Number of samples to draw. Defaults to
+            1.
+
+        Returns:
+            tuple: theta, x
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((num_samples, future))
+        self._pending_samples += num_samples
+
+        if self._pending_samples >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush)
+
+        return await future
+
+    async def simulate_many(
+        self, num_requests: int, num_samples: int = 1
+    ) -> Tuple[Tensor, Tensor]:
+        """Issue many concurrent requests and concatenate their results.
+
+        Args:
+            num_requests (int): Number of requests.
+            num_samples (int, optional): Number of samples per request. Defaults
+            to 1.
+
+        Returns:
+            tuple: theta, x of shape (num_requests * num_samples, dim)
+        """
+        results = await asyncio.gather(
+            *(self.simulate(num_samples) for _ in range(num_requests))
+        )
+        return (
+            torch.cat([theta for theta, _ in results]),
+            torch.cat([x for _, x in results]),
+        )
+
+    def _flush(self) -> None:
+        """Send all pending requests to the simulator as a single batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        requests, self._pending = self._pending, []
+        self._pending_samples = 0
+        if requests:
+            batch = asyncio.ensure_future(self._run_batch(requests))
+            self._batches.add(batch)
+            batch.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, requests: List[Tuple[int, asyncio.Future]]) -> None:
+        """Simulate a batch in the thread pool and split it among the requests."""
+        loop = asyncio.get_running_loop()
+        try:
+            theta, x = await loop.run_in_executor(
+                self._executor, self.simulator, sum(n for n, _ in requests)
+            )
+        except Exception as error:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        start = 0
+        for num_samples, future in requests:
+            if not future.done():
+                future.set_result(
+                    (theta[start : start + num_samples], x[start : start + num_samples])
+                )
+            start += num_samples
+
+    def close(self) -> None:
+        """Shut down the thread pool once all running simulations are done."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "AsyncSimulator":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,13 +1,17 @@
 """Several functions that ease the work with simulated data."""
 
+import hashlib
+import json
 import os
 import time
-from typing import Dict, Tuple
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
+from scipy.spatial import cKDTree
 from torch import Tensor, atleast_2d
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, default_collate
 from torchvision import transforms
 
 
@@ -21,6 +25,11 @@ class SIRSimulation(Dataset):
         simulator_lag: float = 0.1,
         prior: torch.distributions.Distribution = None,
         transformations: transforms.Compose = None,
+        cache_transformed: bool = False,
+        cache_dir: str = None,
+        storage_dtype: Optional[torch.dtype] = None,
+        storage_dtype_x: Optional[torch.dtype] = None,
+        dtype: Optional[torch.dtype] = None,
     ):
         """Simulate from the SIR model.
 
@@ -37,14 +46,42 @@ class SIRSimulation(Dataset):
             prior (torch.distributions.Distribution, optional): Prior. Defaults to
             None.
             transformations (transforms.Compose, optional): Transformations.
+            cache_transformed (bool, optional): Apply the transformations to
+            the whole dataset once and serve items from the result. The cache
+            is rebuilt when the data or the parameters of the transformations
+            change. Defaults to False.
+            cache_dir (str, optional): Directory to store the transformed data
+            in as memory-mapped .npy files, named after a hash of the data and
+            the transformations, so they are reused across runs. Implies
+            `cache_transformed`. Defaults to None, i.e. keep it in memory.
+            storage_dtype (torch.dtype, optional): dtype theta and x are kept
+            in, e.g. torch.float32, see `cast_for_storage`. Casting copies the
+            data, so rather write memory-mapped banks in a compact dtype, see
+            the `dtype` of `load_sir_data`. Defaults to None, i.e. the dtype of
+            the data, which is float32 if it was read with `load_sir_data`
+            without `mmap`.
+            storage_dtype_x (torch.dtype, optional): dtype x is kept in if it
+            differs from `storage_dtype`, e.g. torch.float16 or torch.int16
+            for counts. Defaults to None.
+            dtype (torch.dtype, optional): dtype of the returned items. The
+            stored data is only upcast to it after indexing. Defaults to None,
+            i.e. the dtype theta is stored in.
         """
         super().__init__()
-        self.data_theta = data_theta
-        self.data_x = data_x
+        self.data_theta = cast_for_storage(data_theta, storage_dtype)
+        self.data_x = cast_for_storage(data_x, storage_dtype_x or storage_dtype)
+        self.dtype = dtype or self.data_theta.dtype
         self.data_length = data_theta.shape[0]
         self.lag = simulator_lag
         self.prior = prior
         self.transformations = transformations
+        self.cache_transformed = cache_transformed or cache_dir is not None
+        self.cache_dir = cache_dir
+        self._cache = None
+        self._cache_state = None
+        self._index = None
+        self._index_version = None
+        self._theta_scale = None
 
     def __call__(self, num_samples: int = 1) -> Tuple[Tensor, Tensor]:
         """Sample from the pre-generated data.
@@ -61,8 +98,9 @@ class SIRSimulation(Dataset):
         # draw an index at random
         idx = torch.randint(low=0, high=self.data_length, size=(num_samples,))
 
-        # add dim when num_samples == 1
-        return self.__getitem__(idx)["theta"], self.__getitem__(idx)["x"]
+        # fetch and transform theta and x in a single pass
+        data = self.__getitem__(idx)
+        return data["theta"], data["x"]
 
     def __len__(self) -> int:
         """Length of the dataset.
@@ -81,10 +119,17 @@ class SIRSimulation(Dataset):
         Returns:
             dict: {"theta": theta, "x": x}
         """
-        data = {
-            "theta": atleast_2d(self.data_theta[idx]),
-            "x": atleast_2d(self.data_x[idx]),
-        }
+        if self.cache_transformed and self.transformations:
+            cache = self._transformed_data()
+            return {key: atleast_2d(value[idx]) for key, value in cache.items()}
+
+        data = {}
+        for key, values in (("theta", self.data_theta), ("x", self.data_x)):
+            value = values[idx]
+            # int and slice indices return views, which are copied, so in-place
+            # transformations do not modify the dataset
+            copy = bool(self.transformations) and value._is_view()
+            data[key] = atleast_2d(value.to(self.dtype, copy=copy))
 
         # apply transformations
         if self.transformations:
@@ -92,82 +137,534 @@ class SIRSimulation(Dataset):
 
         return data
 
+    def __getitems__(self, indices: List[int]) -> "SIRBatch":
+        """Get a batch of items with a single index and one transformation.
+
+        Used by the `DataLoader` instead of calling `__getitem__` once per
+        item. Pass `collate_fn=collate_sir_batch` to the `DataLoader` to
+        receive the batched tensors directly.
+
+        Args:
+            indices (list): Indices of the items.
+
+        Returns:
+            SIRBatch: The batch, which also behaves like a list of items.
+        """
+        return SIRBatch(self.__getitem__(torch.as_tensor(indices)))
+
+    def simulate_at(
+        self, theta: Tensor, k: int = 1, interpolate: bool = False
+    ) -> Tuple[Tensor, Tensor]:
+        """Approximate simulations at given parameters from the nearest neighbours.
+
+        Looks up the `k` banked parameters closest to each theta in a KD-tree,
+        which is built on first use. Distances are measured after scaling every
+        parameter by its std over the bank. No simulator lag is imitated.
+
+        Args:
+            theta (torch.Tensor): Parameters of shape (N, dim), before the
+            transformations.
+            k (int, optional): Number of neighbours. Defaults to 1.
+            interpolate (bool, optional): Average the k neighbours weighted by
+            their inverse distance. Defaults to False.
+
+        Returns:
+            tuple: x of shape (N, k, dim_x), or (N, dim_x) if k == 1 or
+            interpolate, and the scaled distances of shape (N, k), or (N,) if
+            k == 1. x is transformed like the output of `__call__`.
+
+        Raises:
+            ValueError: If k is not between 1 and the size of the bank.
+        """
+        if not 1 <= k <= self.data_length:
+            raise ValueError(
+                f"k must be between 1 and the size of the bank, {self.data_length}."
+            )
+        theta = atleast_2d(torch.as_tensor(theta, dtype=self.dtype))
+        version = self.data_theta._version
+        if self._index is None or version != self._index_version:
+            data_theta = _as_float64_numpy(
+                self.data_theta.reshape(self.data_length, -1)
+            )
+            self._theta_scale = data_theta.std(axis=0)
+            self._theta_scale[self._theta_scale == 0] = 1.0
+            self._index = cKDTree(data_theta / self._theta_scale)
+            self._index_version = version
+
+        distances, idx = self._index.query(
+            _as_float64_numpy(theta.reshape(len(theta), -1)) / self._theta_scale, k=k
+        )
+        distances, idx = torch.as_tensor(distances), torch.as_tensor(idx)
+        x = self.data_x[idx].to(self.dtype)
+
+        if interpolate and k > 1:
+            # exact matches dominate instead of dividing by zero
+            weights = 1.0 / distances.clamp(min=1e-12)
+            weights = (weights / weights.sum(dim=1, keepdim=True)).to(x.dtype)
+            x = (weights.reshape(weights.shape + (1,) * (x.dim() - 2)) * x).sum(dim=1)
+
+        if self.transformations:
+            # x is a copy already, theta is cloned for in-place transformations
+            x = self.transformations({"theta": theta.clone(), "x": x})["x"]
+
+        return x, distances
+
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+        # new data or transformations invalidate what was derived from them
+        if name in ("data_theta", "data_x", "transformations"):
+            super().__setattr__("_cache", None)
+        if name == "data_theta":
+            super().__setattr__("_index", None)
+
+    def _watch(self) -> list:
+        """Tensors the transformed data depends on, with their current version.
+
+        Computed once when the cache is built. The version counter of a tensor
+        increases with every in-place modification. The tensors are held by
+        reference, so a tensor that replaces a transformation parameter is
+        noticed as well.
+        """
+        owners = [(self, "data_theta"), (self, "data_x")] + [
+            (transform, name)
+            for transform in self._transforms()
+            for name, value in getattr(transform, "__dict__", {}).items()
+            if isinstance(value, Tensor)
+        ]
+        return [
+            (owner, name, getattr(owner, name), getattr(owner, name)._version)
+            for owner, name in owners
+        ]
+
+    def _transforms(self) -> list:
+        """The transformations as a list, unpacked from a `Compose`."""
+        transformations = getattr(self.transformations, "transforms", None)
+        if transformations is None:
+            transformations = [self.transformations]
+        return transformations
+
+    def _cache_key(self, chunk_size: int = 100_000) -> str:
+        """Hash of the data and the transformations that is stable across runs.
+
+        Transformations are identified by their class and the values of their
+        attributes, e.g. the statistics of a `SIRStdScaler`.
+        """
+        digest = hashlib.sha256()
+        for transform in self._transforms():
+            # functions are named by themselves, other callables by their class
+            name = getattr(transform, "__qualname__", type(transform).__qualname__)
+            digest.update(f"{transform.__module__}.{name}".encode())
+            _hash_state(digest, getattr(transform, "__dict__", None))
+        for data in (self.data_theta, self.data_x):
+            digest.update(str((data.dtype, tuple(data.shape))).encode())
+            for start in range(0, self.data_length, chunk_size):
+                chunk = data[start : start + chunk_size].contiguous()
+                digest.update(chunk.numpy().tobytes())
+        return digest.hexdigest()
+
+    def _transformed_data(self) -> Dict[str, Tensor]:
+        """Transformed theta and x, rebuilt if the inputs changed."""
+        if self._cache is not None and not any(
+            getattr(owner, name) is not value or value._version != version
+            for owner, name, value, version in self._cache_state
+        ):
+            return self._cache
+
+        self._cache_state = self._watch()
+        self._cache = self._transform_all()
+        return self._cache
+
+    def _transform_chunks(self, chunk_size: int) -> Iterator[Dict[str, Tensor]]:
+        """Transformed chunks of the whole dataset."""
+        for start in range(0, self.data_length, chunk_size):
+            stop = start + chunk_size
+            # copy, so in-place transformations do not modify the dataset
+            chunk = {
+                key: atleast_2d(data[start:stop]).to(self.dtype, copy=True)
+                for key, data in (("theta", self.data_theta), ("x", self.data_x))
+            }
+            yield self.transformations(chunk)
+
+    def _transform_all(self, chunk_size: int = 100_000) -> Dict[str, Tensor]:
+        """Apply the transformations to the whole dataset chunk by chunk."""
+        if self.cache_dir is None:
+            chunks = list(self._transform_chunks(chunk_size))
+            return {
+                key: torch.cat([chunk[key] for chunk in chunks])
+                for key in ("theta", "x")
+            }
+
+        key = self._cache_key(chunk_size)
+        paths = {
+            name: os.path.join(self.cache_dir, f"{key}_{name}.npy")
+            for name in ("theta", "x")
+        }
+        if not all(os.path.exists(path) for path in paths.values()):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_paths = {
+                name: f"{path}.{os.getpid()}.tmp" for name, path in paths.items()
+            }
+            # every chunk is written to the files directly, so only a single
+            # transformed chunk is held in memory
+            outputs, start = {}, 0
+            for chunk in self._transform_chunks(chunk_size):
+                for name, value in chunk.items():
+                    if name not in outputs:
+                        outputs[name] = np.lib.format.open_memmap(
+                            tmp_paths[name],
+                            mode="w+",
+                            dtype=value.numpy().dtype,
+                            shape=(self.data_length,) + tuple(value.shape[1:]),
+                        )
+                    outputs[name][start : start + len(value)] = value.numpy()
+                start += len(chunk["theta"])
+            for output in outputs.values():
+                output.flush()
+            outputs.clear()
+            for name, tmp_path in tmp_paths.items():
+                os.replace(tmp_path, paths[name])
+
+        return {
+            name: torch.from_numpy(np.load(path, mmap_mode="c"))
+            for name, path in paths.items()
+        }
+
+
+def cast_for_storage(data: Tensor, dtype: Optional[torch.dtype]) -> Tensor:
+    """Cast data to a compact storage dtype.
+
+    Casting to an integer dtype rounds the data, which is lossless for counts
+    such as the number of infected individuals.
+
+    Args:
+        data (torch.Tensor): Data.
+        dtype (torch.dtype, optional): Storage dtype. None keeps the data as is.
+
+    Returns:
+        torch.Tensor: The data in the storage dtype, not copied if it already
+        has it.
+
+    Raises:
+        ValueError: If the data is out of the range of the storage dtype.
+    """
+    if dtype is None or data.dtype == dtype:
+        return data
+
+    if dtype.is_floating_point:
+        info = torch.finfo(dtype)
+    else:
+        info = torch.iinfo(dtype)
+        if data.is_floating_point():
+            data = data.round()
+    if data.numel() and (data.min() < info.min or data.max() > info.max):
+        raise ValueError(f"Data does not fit into {dtype}.")
+
+    return data.to(dtype)
+
+
+def _as_float64_numpy(value: Tensor) -> np.ndarray:
+    """Detached float64 copy for scipy, also for bfloat16 and integer tensors."""
+    return value.detach().cpu().double().numpy()
+
+
+def _hash_state(digest, value) -> None:
+    """Update a digest with the values of tensors in (nested) containers."""
+    if isinstance(value, Tensor):
+        value = value.detach().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}".encode())
+        for key, item in value.items():
+            digest.update(repr(key).encode())
+            _hash_state(digest, item)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _hash_state(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+class SIRBatch(Sequence):
+    """Batch of SIR data that can be collated without per-item work."""
+
+    def __init__(self, data: Dict[str, Tensor]):
+        """Batch of SIR data that can be collated without per-item work.
+
+        Behaves like the list of items that the `DataLoader` would otherwise
+        collect, so the default collate function keeps working. Items are only
+        created when accessed, `collate_sir_batch` skips them altogether.
+
+        Args:
+            data (dict): {"theta": theta, "x": x} with a leading batch dim.
+        """
+        self.data = data
+
+    def __len__(self) -> int:
+        return self.data["theta"].shape[0]
+
+    def __getitem__(self, idx: int) -> Dict[str, Tensor]:
+        # slicing does not raise, but iterating a Sequence relies on IndexError
+        if not -len(self) <= idx < len(self):
+            raise IndexError("SIRBatch index out of range")
+        idx = idx % len(self)
+
+        # same shapes as SIRSimulation.__getitem__ with a single index
+        return {key: value[idx : idx + 1] for key, value in self.data.items()}
+
+
+def collate_sir_batch(
+    batch: Union[SIRBatch, List[Dict[str, Tensor]]]
+) -> Dict[str, Tensor]:
+    """Collate function for `DataLoader`s over `SIRSimulation`.
+
+    Args:
+        batch (SIRBatch or list): Batch returned by `SIRSimulation.__getitems__`
+        or a list of items.
+
+    Returns:
+        dict: {"theta": theta, "x": x}, of shape (batch_size, dim) for a
+        `SIRBatch`, otherwise as returned by `default_collate`.
+    """
+    if isinstance(batch, SIRBatch):
+        return batch.data
+    return default_collate(batch)
+
 
 class SIRStdScaler:
     """Standardize the SIR data."""
 
+    file_name = "sir_scaler.json"
+
     def __init__(
         self,
         mean_theta: Tensor = torch.tensor([0.45, 0.13]),
         std_theta: Tensor = torch.tensor([0.24, 0.026]),
         mean_x: Tensor = torch.tensor([40.5]),
         std_x: Tensor = torch.tensor([90.35]),
+        inplace: bool = False,
     ):
         """Standardize the SIR data.
 
+        With `inplace=True` theta and x are overwritten instead of allocating
+        new tensors. Only use it on tensors you own. `SIRSimulation` always
+        passes copies to its transformations, also for int and slice indices.
+
         Args:
             mean_theta (torch.Tensor, optional): Empirical mean of theta.
             std_theta (torch.Tensor, optional): Empirical std of theta.
             mean_x (torch.Tensor, optional): Empirical mean of x.
             std_x (torch.Tensor, optional): Empirical std of x.
+            inplace (bool, optional): Default for the `inplace` argument of
+            `__call__` and `rescale`. Defaults to False.
         """
         self.mean_theta = mean_theta
         self.std_theta = std_theta
         self.mean_x = mean_x
         self.std_x = std_x
+        self.inplace = inplace
+
+    @classmethod
+    def fit_streaming(
+        cls, batches: Iterable, per_feature_x: bool = False, **kwargs
+    ) -> "SIRStdScaler":
+        """Fit the statistics in a single pass over chunks of the data.
+
+        Chunk statistics are merged with the parallel variant of Welford's
+        algorithm in float64, so the data never has to be in memory at once.
+        Like the defaults, theta is standardized per parameter and x with a
+        single mean and std over all entries, unless `per_feature_x` is set.
+
+        Args:
+            batches (iterable): Chunks as dicts {"theta": theta, "x": x} or
+            tuples (theta, x) with a leading batch dim, e.g. a `DataLoader`.
+            per_feature_x (bool, optional): Standardize every entry of x
+            separately. Defaults to False.
+            **kwargs: Passed on to the constructor.
 
-    def __call__(self, batch: Tensor) -> Dict[str, Tensor]:
+        Returns:
+            SIRStdScaler: Scaler with the fitted statistics.
+        """
+        stats = {"theta": None, "x": None}
+        for batch in batches:
+            if isinstance(batch, dict):
+                batch = batch["theta"], batch["x"]
+            for key, value in zip(("theta", "x"), batch):
+                value = torch.as_tensor(value, dtype=torch.float64)
+                if key == "x" and not per_feature_x:
+                    value = value.reshape(-1, 1)
+                else:
+                    value = value.reshape(-1, value.shape[-1])
+                stats[key] = _merge_moments(stats[key], value)
+
+        if stats["theta"] is None:
+            raise ValueError("Cannot fit the scaler on an empty iterable.")
+
+        return cls(
+            mean_theta=stats["theta"][1].float(),
+            std_theta=(stats["theta"][2] / stats["theta"][0]).sqrt().float(),
+            mean_x=stats["x"][1].float(),
+            std_x=(stats["x"][2] / stats["x"][0]).sqrt().float(),
+            **kwargs,
+        )
+
+    def save(self, base_path: str, file_name: str = None) -> None:
+        """Save the statistics next to the data.
+
+        Args:
+            base_path (str): Path to the data.
+            file_name (str, optional): Name of the file. Defaults to
+            "sir_scaler.json".
+        """
+        stats = {
+            "mean_theta": self.mean_theta.tolist(),
+            "std_theta": self.std_theta.tolist(),
+            "mean_x": self.mean_x.tolist(),
+            "std_x": self.std_x.tolist(),
+        }
+        with open(os.path.join(base_path, file_name or self.file_name), "w") as file:
+            json.dump(stats, file)
+
+    @classmethod
+    def load(cls, base_path: str, file_name: str = None, **kwargs) -> "SIRStdScaler":
+        """Load statistics saved with `save`.
+
+        Args:
+            base_path (str): Path to the data.
+            file_name (str, optional): Name of the file. Defaults to
+            "sir_scaler.json".
+            **kwargs: Passed on to the constructor.
+
+        Returns:
+            SIRStdScaler: Scaler with the loaded statistics.
+        """
+        with open(os.path.join(base_path, file_name or cls.file_name)) as file:
+            stats = json.load(file)
+        stats = {key: torch.tensor(value) for key, value in stats.items()}
+        return cls(**stats, **kwargs)
+
+    def __call__(self, batch: Tensor, inplace: bool = None) -> Dict[str, Tensor]:
         """Standardize theta and x.
 
         Args:
             theta (torch.Tensor): Parameters.
             x (torch.Tensor): Observations.
+            inplace (bool, optional): Overwrite theta and x. Defaults to the
+            value given to the constructor.
 
         Returns:
             dict: {"theta": theta, "x": x}
         """
         theta, x = batch["theta"], batch["x"]
 
-        theta = (theta - self.mean_theta) / self.std_theta
-        x = (x - self.mean_x) / self.std_x
+        if self.inplace if inplace is None else inplace:
+            theta = theta.sub_(self.mean_theta).div_(self.std_theta)
+            x = x.sub_(self.mean_x).div_(self.std_x)
+        else:
+            theta = (theta - self.mean_theta) / self.std_theta
+            x = (x - self.mean_x) / self.std_x
 
         return {"theta": theta, "x": x}
 
-    def rescale(self, batch: Tensor) -> Dict[str, Tensor]:
+    def rescale(self, batch: Tensor, inplace: bool = None) -> Dict[str, Tensor]:
         """Rescale theta and x.
 
         Args:
             theta (torch.Tensor): Parameters.
             x (torch.Tensor): Observations.
+            inplace (bool, optional): Overwrite theta and x. Defaults to the
+            value given to the constructor.
 
         Returns:
             dict: {"theta": theta, "x": x}
         """
         theta, x = batch["theta"], batch["x"]
 
-        theta = theta * self.std_theta + self.mean_theta
-        x = x * self.std_x + self.mean_x
+        if self.inplace if inplace is None else inplace:
+            theta = theta.mul_(self.std_theta).add_(self.mean_theta)
+            x = x.mul_(self.std_x).add_(self.mean_x)
+        else:
+            theta = theta * self.std_theta + self.mean_theta
+            x = x * self.std_x + self.mean_x
 
         return {"theta": theta, "x": x}
 
 
+def _merge_moments(
+    stats: Optional[Tuple[int, Tensor, Tensor]], value: Tensor
+) -> Tuple[int, Tensor, Tensor]:
+    """Merge count, mean and sum of squared deviations with those of a chunk."""
+    count = value.shape[0]
+    if count == 0:
+        return stats
+    mean = value.mean(dim=0)
+    m2 = ((value - mean) ** 2).sum(dim=0)
+    if stats is None:
+        return count, mean, m2
+
+    total_count, total_mean, total_m2 = stats
+    delta = mean - total_mean
+    new_count = total_count + count
+    return (
+        new_count,
+        total_mean + delta * count / new_count,
+        total_m2 + m2 + delta**2 * total_count * count / new_count,
+    )
+
+
 def load_sir_data(
     base_path: str,
     file_name_thetas: str = "sir_thetas.npy",
     file_name_x: str = "sir_x_obs.npy",
+    mmap: bool = False,
+    dtype: Optional[torch.dtype] = None,
+    dtype_x: Optional[torch.dtype] = None,
 ) -> Tuple[Tensor, Tensor]:
     """Load the pre-generated data.
 
+    With `mmap=True` the files are memory-mapped instead of read, and the
+    returned tensors share the mapped buffers. Loading is then near-instant
+    and `SIRSimulation` only reads the rows it indexes. The mapping is
+    copy-on-write, so in-place changes to the tensors stay private and never
+    reach the files, while untouched pages are shared through the page cache
+    by all processes, e.g. forked `DataLoader` workers.
+
+    `dtype` casts the data once while loading, see `cast_for_storage`. Files
+    that already have the dtype are not copied, so write banks in it, e.g.
+    with the `dtype` of `simulate_parallel`, to keep memory-mapping zero-copy.
+    Without `mmap` the files are copied into memory anyway, so floating-point
+    data is stored in float32 by default, which halves the memory of float64
+    banks.
+
     Args:
         base_path (str): Path to the data.
         fie_name_thetas (str, optional): Name of the file containing thetas.
         file_name_x (str, optional): Name of the file containing the observations.
+        mmap (bool, optional): Memory-map the files. Defaults to False.
+        dtype (torch.dtype, optional): dtype of theta and x, e.g.
+        torch.float64 to keep float64 files. Defaults to None, i.e.
+        torch.float32 for floating-point data without `mmap` and the dtype of
+        the files otherwise.
+        dtype_x (torch.dtype, optional): dtype of x if it differs from
+        `dtype`, e.g. torch.int16 for counts. Defaults to None.
 
     Returns:
         tuple: theta, x
     """
+    mmap_mode = "c" if mmap else None
+
+    theta = np.load(os.path.join(base_path, file_name_thetas), mmap_mode=mmap_mode)
+    x = np.load(os.path.join(base_path, file_name_x), mmap_mode=mmap_mode)
 
-    theta = np.load(os.path.join(base_path, file_name_thetas))
-    x = np.load(os.path.join(base_path, file_name_x))
+    theta, x = torch.from_numpy(theta), torch.from_numpy(x)
+    dtype_x = dtype_x or dtype
+    if not mmap:
+        # the data is read into memory anyway, so it is cast to float32 once
+        if dtype is None and theta.is_floating_point():
+            dtype = torch.float32
+        if dtype_x is None and x.is_floating_point():
+            dtype_x = torch.float32
 
-    return torch.from_numpy(theta), torch.from_numpy(x)
+    return cast_for_storage(theta, dtype), cast_for_storage(x, dtype_x)
@@ -0,0 +1,178 @@
+"""Tabulated emulator of the SIR model for fast lookups inside the prior box."""
+
+import json
+import os
+from typing import Tuple
+
+import numpy as np
+
+from .utils_sir import eval_sir_model_batch
+
+
+class SIREmulator:
+    """Emulate the SIR model by interpolating precomputed trajectories."""
+
+    table_file_name = "sir_emulator_table.npy"
+    meta_file_name = "sir_emulator_meta.json"
+
+    def __init__(self, base_path: str):
+        """Emulate the SIR model by interpolating precomputed trajectories.
+
+        The trajectories are precomputed with `build` on a regular (beta,
+        gamma) grid and stored on disk. The table is memory-mapped, so only
+        the rows needed for a query are read. Queries are answered by bilinear
+        interpolation between the four surrounding grid points.
+
+        Args:
+            base_path (str): Directory created by `build`.
+        """
+        with open(os.path.join(base_path, self.meta_file_name)) as file:
+            meta = json.load(file)
+        self.table = np.load(
+            os.path.join(base_path, self.table_file_name), mmap_mode="r"
+        )
+        self.beta_range = tuple(meta["beta_range"])
+        self.gamma_range = tuple(meta["gamma_range"])
+        self.initial_cond = tuple(meta["initial_cond"])
+        self.population_size = meta["population_size"]
+        self.grid_points = np.asarray(meta["grid_points"])
+        self.max_validation_error = meta["max_validation_error"]
+
+    @classmethod
+    def build(
+        cls,
+        base_path: str,
+        beta_range: Tuple[float, float] = (0.0, 2.5),
+        gamma_range: Tuple[float, float] = (0.05, 0.25),
+        num_beta: int = 256,
+        num_gamma: int = 64,
+        initial_cond: tuple = (999, 1, 0),
+        population_size: int = 1_000,
+        grid_points: np.array = np.linspace(0, 160, 160),
+        num_validation: int = 1_000,
+        seed: int = 0,
+    ) -> "SIREmulator":
+        """Precompute the table and estimate the interpolation error.
+
+        `max_validation_error` is the largest absolute deviation from
+        `eval_sir_model_batch` over `num_validation` random cell centers, which
+        is where bilinear interpolation is least accurate. It is a sampled
+        estimate, not a bound: cells that were not sampled can deviate more.
+
+        Args:
+            base_path (str): Directory to store the table in.
+            beta_range (tuple, optional): Range of the infection rate. Defaults
+            to (0.0, 2.5).
+            gamma_range (tuple, optional): Range of the recovery rate. Defaults
+            to (0.05, 0.25).
+            num_beta (int, optional): Number of grid points for beta. Defaults
+            to 256.
+            num_gamma (int, optional): Number of grid points for gamma. Defaults
+            to 64.
+            initial_cond (tuple, optional): Initial cond. S0, I0 and R0. Defaults
+            to (999, 1, 0).
+            population_size (int, optional): Population size. Defaults to 1_000.
+            grid_points (np.array, optional): Grid point, i.e. time. Defaults to
+            np.linspace(0, 160, 160).
+            num_validation (int, optional): Number of cell centers used to
+            estimate the interpolation error. Defaults to 1_000.
+            seed (int, optional): Seed for choosing the validation cells.
+            Defaults to 0.
+
+        Returns:
+            SIREmulator: The emulator backed by the new table.
+        """
+        os.makedirs(base_path, exist_ok=True)
+        betas = np.linspace(*beta_range, num_beta)
+        gammas = np.linspace(*gamma_range, num_gamma)
+
+        table = np.lib.format.open_memmap(
+            os.path.join(base_path, cls.table_file_name),
+            mode="w+",
+            dtype=np.float64,
+            shape=(num_beta, num_gamma, len(grid_points), 3),
+        )
+        # simulate a few rows of beta at a time to bound the memory usage
+        rows_per_batch = max(1, 4096 // num_gamma)
+        for start in range(0, num_beta, rows_per_batch):
+            beta_grid, gamma_grid = np.meshgrid(
+                betas[start : start + rows_per_batch], gammas, indexing="ij"
+            )
+            theta = np.stack([beta_grid.ravel(), gamma_grid.ravel()], axis=1)
+            table[start : start + rows_per_batch] = eval_sir_model_batch(
+                theta, initial_cond, population_size, grid_points
+            ).reshape(beta_grid.shape + table.shape[2:])
+        table.flush()
+        del table
+
+        meta = {
+            "beta_range": list(beta_range),
+            "gamma_range": list(gamma_range),
+            "initial_cond": list(initial_cond),
+            "population_size": population_size,
+            "grid_points": np.asarray(grid_points).tolist(),
+            "max_validation_error": None,
+        }
+        with open(os.path.join(base_path, cls.meta_file_name), "w") as file:
+            json.dump(meta, file)
+
+        emulator = cls(base_path)
+        rng = np.random.default_rng(seed)
+        theta_val = np.stack(
+            [
+                betas[rng.integers(num_beta - 1, size=num_validation)]
+                + 0.5 * (betas[1] - betas[0]),
+                gammas[rng.integers(num_gamma - 1, size=num_validation)]
+                + 0.5 * (gammas[1] - gammas[0]),
+            ],
+            axis=1,
+        )
+        error = np.abs(
+            emulator(theta_val)
+            - eval_sir_model_batch(
+                theta_val, initial_cond, population_size, grid_points
+            )
+        )
+        meta["max_validation_error"] = float(error.max())
+        emulator.max_validation_error = meta["max_validation_error"]
+        with open(os.path.join(base_path, cls.meta_file_name), "w") as file:
+            json.dump(meta, file)
+
+        return emulator
+
+    def __call__(self, theta: np.ndarray) -> np.ndarray:
+        """Interpolate the trajectories for a batch of parameters.
+
+        Args:
+            theta (np.array): Input params beta and gamma of shape (N, 2).
+
+        Returns:
+            np.array: array of shape (N, grid_points.shape[0], 3) where the
+            order of the last dimension is SIR.
+        """
+        theta = np.atleast_2d(np.asarray(theta, dtype=np.float64))
+        i, weight_beta = self._cell(theta[:, 0], self.beta_range, self.table.shape[0])
+        j, weight_gamma = self._cell(theta[:, 1], self.gamma_range, self.table.shape[1])
+        weight_beta = weight_beta[:, None, None]
+        weight_gamma = weight_gamma[:, None, None]
+
+        return (1 - weight_beta) * (
+            (1 - weight_gamma) * self.table[i, j] + weight_gamma * self.table[i, j + 1]
+        ) + weight_beta * (
+            (1 - weight_gamma) * self.table[i + 1, j]
+            + weight_gamma * self.table[i + 1, j + 1]
+        )
+
+    @staticmethod
+    def _cell(
+        values: np.ndarray, value_range: Tuple[float, float], num_points: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Index of the lower grid point and the interpolation weight."""
+        low, high = value_range
+        if np.any(values < low) or np.any(values > high):
+            raise ValueError(
+                f"Parameters outside of the tabulated range [{low}, {high}]."
+            )
+        position = (values - low) / (high - low) * (num_points - 1)
+        index = np.minimum(position.astype(int), num_points - 2)
+        return index, position - index
@@ -0,0 +1,125 @@
+"""Export of trained mixture density networks for serving."""
+
+import copy
+from typing import Tuple
+
+import torch
+import torch.nn as nn
+from torch import Tensor
+
+from .data_utils import SIRStdScaler
+from .mdn import MultivariateGaussianMDN, mog_log_prob_from_log_variances
+
+
+class ExportableMDN(nn.Module):
+    """Self-contained `MultivariateGaussianMDN` with the scaling folded in."""
+
+    def __init__(self, mdn: MultivariateGaussianMDN, scaler: SIRStdScaler = None):
+        """Self-contained `MultivariateGaussianMDN` with the scaling folded in.
+
+        The module only consists of the layers of the mdn and the statistics
+        of the scaler, so it can be compiled with TorchScript. It takes x and
+        theta in the original, unstandardized space: x is standardized before
+        the hidden network, samples are rescaled, and log probabilities
+        include the log Jacobian of the standardization of theta. The layers
+        are copied, so the module does not share them with the mdn.
+
+        Args:
+            mdn (MultivariateGaussianMDN): Trained mdn.
+            scaler (SIRStdScaler, optional): Scaler the mdn was trained with.
+            Defaults to None, i.e. no scaling.
+        """
+        super().__init__()
+        mdn = copy.deepcopy(mdn)
+        self.features = mdn._features
+        self.num_components = mdn._num_components
+        self.hidden_net = mdn._hidden_net
+        self.logits_layer = mdn._logits_layer
+        self.means_layer = mdn._means_layer
+        self.unconstrained_diagonal_layer = mdn._unconstrained_diagonal_layer
+
+        if scaler is None:
+            scaler = SIRStdScaler(
+                mean_theta=torch.zeros(1),
+                std_theta=torch.ones(1),
+                mean_x=torch.zeros(1),
+                std_x=torch.ones(1),
+            )
+        for name in ("mean_theta", "std_theta", "mean_x", "std_x"):
+            self.register_buffer(name, torch.as_tensor(getattr(scaler, name)).float())
+
+    def forward(self, x: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+        """Returns logits, means and log-variances in the standardized space."""
+        h = self.hidden_net((x - self.mean_x) / self.std_x)
+
+        logits = self.logits_layer(h)
+        logits = logits - torch.logsumexp(logits, dim=1).unsqueeze(1)
+        means = self.means_layer(h).view(-1, self.num_components, self.features)
+        log_variances = self.unconstrained_diagonal_layer(h).view(
+            -1, self.num_components, self.features
+        )
+
+        return logits, means, log_variances
+
+    @torch.jit.export
+    def log_prob(self, theta: Tensor, x: Tensor) -> Tensor:
+        """Returns the log probability of theta conditioned on x."""
+        logits, means, log_variances = self.forward(x)
+        theta = (theta - self.mean_theta) / self.std_theta
+        log_prob = mog_log_prob_from_log_variances(theta, logits, means, log_variances)
+
+        # change of variables from the standardized to the original theta
+        log_jacobian = torch.log(self.std_theta).expand(self.features).sum()
+        return log_prob - log_jacobian
+
+    @torch.jit.export
+    def sample(self, num_samples: int, x: Tensor) -> Tensor:
+        """Samples of shape (batch_size, num_samples, features) given x."""
+        logits, means, log_variances = self.forward(x)
+
+        choices = torch.multinomial(
+            torch.softmax(logits, dim=-1), num_samples=num_samples, replacement=True
+        )
+        index = choices.unsqueeze(-1).expand(-1, -1, self.features)
+        chosen_means = means.gather(1, index)
+        chosen_stds = torch.exp(0.5 * log_variances).gather(1, index)
+        samples = chosen_means + torch.randn_like(chosen_means) * chosen_stds
+
+        return samples * self.std_theta + self.mean_theta
+
+
+def export_mdn(
+    mdn: MultivariateGaussianMDN, path: str, scaler: SIRStdScaler = None
+) -> torch.jit.ScriptModule:
+    """Compile a trained mdn with TorchScript and save it.
+
+    The saved artifact only needs torch to be loaded, see `load_mdn`. It
+    provides `forward` for the mixture components, `log_prob(theta, x)` and
+    `sample(num_samples, x)`.
+
+    Args:
+        mdn (MultivariateGaussianMDN): Trained mdn.
+        path (str): File to save the artifact to.
+        scaler (SIRStdScaler, optional): Scaler the mdn was trained with,
+        folded into the graph. Defaults to None.
+
+    Returns:
+        torch.jit.ScriptModule: The compiled module.
+    """
+    module = torch.jit.script(ExportableMDN(mdn, scaler).eval())
+    module.save(path)
+    return module
+
+
+def load_mdn(path: str) -> torch.jit.ScriptModule:
+    """Load an mdn exported with `export_mdn` for inference on the CPU.
+
+    Args:
+        path (str): File the artifact was saved to.
+
+    Returns:
+        torch.jit.ScriptModule: Module with `forward`, `log_prob` and `sample`.
+    """
+    module = torch.jit.load(path, map_location="cpu").eval()
+    # inline the parameters as constants, which does not change the outputs
+    return torch.jit.freeze(module, preserved_attrs=["log_prob", "sample"])
@@ -1,9 +1,13 @@
+import copy
+import math
 from math import log, pi
+from typing import Dict, Tuple
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch import Tensor, tensor
+from torch.nn.utils import prune
 
 
 class MultivariateGaussianMDN(nn.Module):
@@ -30,46 +34,245 @@ class MultivariateGaussianMDN(nn.Module):
             hidden_features, num_components * features
         )
 
+        self._log_prob_method = None
+        self._log_prob_kernel = mog_log_prob_from_log_variances
+
+    def __getstate__(self):
+        # compiled kernels can neither be pickled nor deep-copied, so only the
+        # method is kept and the kernel is compiled again in __setstate__
+        state = self.__dict__.copy()
+        state.pop("_log_prob_kernel", None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        method = getattr(self, "_log_prob_method", None)
+        if method is None:
+            self._log_prob_kernel = mog_log_prob_from_log_variances
+        else:
+            self._log_prob_kernel = compile_mog_log_prob(method)
+
     def get_mixture_components(self, context):
+        logits, means, log_variances = self.get_mixture_log_components(context)
+        variances = torch.exp(log_variances)
+
+        return logits, means, variances
+
+    def get_mixture_log_components(self, context):
+        """Like `get_mixture_components`, but returns log-variances."""
         h = self._hidden_net(context)
 
-        logits = self._logits_layer(h)
+        logits = full_precision(self._logits_layer(h))
         logits = logits - torch.logsumexp(logits, dim=1).unsqueeze(1)
-        means = self._means_layer(h).view(-1, self._num_components, self._features)
+        means = full_precision(self._means_layer(h)).view(
+            -1, self._num_components, self._features
+        )
 
-        log_variances = self._unconstrained_diagonal_layer(h).view(
+        log_variances = full_precision(self._unconstrained_diagonal_layer(h)).view(
             -1, self._num_components, self._features
         )
-        variances = torch.exp(log_variances)
 
-        return logits, means, variances
+        return logits, means, log_variances
+
+    def compile_log_prob(self, method: str = "script") -> None:
+        """Compile the kernel used by `log_prob`, see `compile_mog_log_prob`."""
+        self._log_prob_kernel = compile_mog_log_prob(method)
+        self._log_prob_method = method
 
-    def sample(self, num_samples: int, context: Tensor):
+    def sample(self, num_samples: int, context: Tensor, mixed_precision: bool = False):
         """Samples from the mdn given the context.
 
         Note: samples num_samples samples for each context in the batch.
+        With mixed_precision, the networks run in bfloat16 under autocast,
+        while the mixture is sampled in float32.
 
         Returns:
             Tensor: samples of shape (batch_size, num_samples, features)
         """
         assert context.ndim == 2, "context should have a batch dimension."
 
-        # repeat the context to match the number of samples
-        context = context.unsqueeze(1).repeat(1, num_samples, 1)
-        # reshape context to single batch dim for get_mixture_components
-        with torch.no_grad():
-            logits, means, variances = self.get_mixture_components(
-                context.view(-1, context.size(-1))
-            )
-        samples = mog_sample(logits, means, variances)
+        # the mixture components only depend on the context, not on the sample
+        with torch.no_grad(), torch.autocast(
+            context.device.type, dtype=torch.bfloat16, enabled=mixed_precision
+        ):
+            logits, means, variances = self.get_mixture_components(context)
+
+        return mog_sample(logits, means, variances, num_samples)
+
+    def log_prob(self, theta, context):
+        """Returns the log probability of theta conditioned on the context."""
+        logits, means, log_variances = self.get_mixture_log_components(context)
+        return self._log_prob_kernel(theta, logits, means, log_variances)
+
+    def log_prob_grid(
+        self, theta_grid: Tensor, context: Tensor, max_elements: int = 2**24
+    ) -> Tensor:
+        """Returns the log probability of every grid point for every context.
+
+        Args:
+            theta_grid: grid of shape (num_points, features).
+            context: contexts of shape (batch_size, context_features).
+            max_elements: bound on the size of the intermediate tensors, the
+                grid is evaluated in chunks to stay below it.
+
+        Returns:
+            Tensor: log probabilities of shape (batch_size, num_points)
+        """
+        logits, means, log_variances = self.get_mixture_log_components(context)
+        return mog_log_prob_grid(theta_grid, logits, means, log_variances, max_elements)
+
+    def quantize(
+        self, theta: Tensor = None, context: Tensor = None, prune_amount: float = 0.0
+    ) -> Tuple["MultivariateGaussianMDN", Dict[str, float]]:
+        """Returns a copy for CPU inference with int8 dynamically quantized layers.
+
+        All linear layers, i.e. those of the hidden net and the heads, get int8
+        weights, and activations are quantized on the fly. Optionally, the
+        prune_amount fraction of weights with the smallest magnitude in every
+        linear layer is set to zero first. The copy can be exported with
+        `export.export_mdn`.
+
+        Args:
+            theta: held-out parameters to measure the accuracy impact on.
+            context: held-out contexts belonging to theta.
+            prune_amount: fraction of weights to prune per linear layer.
+
+        Returns:
+            the quantized copy and a report with the mean change of the
+            held-out log_prob and its mean absolute change, empty if no
+            held-out data is given.
+        """
+        model = copy.deepcopy(self).eval()
+        if prune_amount > 0:
+            for module in model.modules():
+                if isinstance(module, nn.Linear):
+                    prune.l1_unstructured(module, "weight", amount=prune_amount)
+                    prune.remove(module, "weight")
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+
+        report = {}
+        if theta is not None:
+            with torch.no_grad():
+                change = model.log_prob(theta, context) - self.log_prob(theta, context)
+            report["log_prob_change"] = change.mean().item()
+            report["abs_log_prob_change"] = change.abs().mean().item()
+
+        return model, report
+
+
+class FullCovarianceGaussianMDN(nn.Module):
+    """
+    Mixture density network with full covariances, parametrized by their
+    lower-triangular Cholesky factors with a positive diagonal.
+    """
+
+    def __init__(
+        self,
+        features,
+        hidden_net,
+        num_components,
+        hidden_features,
+    ):
+        super().__init__()
+
+        self._features = features
+        self._num_components = num_components
+        self._hidden_net = hidden_net
+        self._logits_layer = nn.Linear(hidden_features, num_components)
+        self._means_layer = nn.Linear(hidden_features, num_components * features)
+        self._log_diagonal_layer = nn.Linear(hidden_features, num_components * features)
+        self._off_diagonal_layer = nn.Linear(
+            hidden_features, num_components * features * (features - 1) // 2
+        )
+        self.register_buffer(
+            "_off_diagonal_indices", torch.tril_indices(features, features, -1)
+        )
+
+    def get_mixture_components(self, context):
+        """Returns logits, means and Cholesky factors of the covariances."""
+        h = self._hidden_net(context)
+
+        logits = full_precision(self._logits_layer(h))
+        logits = logits - torch.logsumexp(logits, dim=1).unsqueeze(1)
+        means = full_precision(self._means_layer(h)).view(
+            -1, self._num_components, self._features
+        )
+
+        log_diagonal = full_precision(self._log_diagonal_layer(h)).view(
+            -1, self._num_components, self._features
+        )
+        scale_tril = torch.diag_embed(torch.exp(log_diagonal))
+        rows, cols = self._off_diagonal_indices
+        scale_tril[..., rows, cols] = full_precision(self._off_diagonal_layer(h)).view(
+            -1, self._num_components, rows.numel()
+        )
+
+        return logits, means, scale_tril
+
+    def sample(self, num_samples: int, context: Tensor, mixed_precision: bool = False):
+        """Samples from the mdn given the context.
+
+        See `MultivariateGaussianMDN.sample` for mixed_precision.
+
+        Returns:
+            Tensor: samples of shape (batch_size, num_samples, features)
+        """
+        assert context.ndim == 2, "context should have a batch dimension."
+
+        with torch.no_grad(), torch.autocast(
+            context.device.type, dtype=torch.bfloat16, enabled=mixed_precision
+        ):
+            logits, means, scale_tril = self.get_mixture_components(context)
 
-        # reshape batch to match the input shape
-        return samples.view(-1, num_samples, self._features)
+        return mog_sample_cholesky(logits, means, scale_tril, num_samples)
 
     def log_prob(self, theta, context):
         """Returns the log probability of theta conditioned on the context."""
-        logits, means, variances = self.get_mixture_components(context)
-        return mog_log_prob(theta, logits, means, variances)
+        logits, means, scale_tril = self.get_mixture_components(context)
+        return mog_log_prob_cholesky(theta, logits, means, scale_tril)
+
+    def log_prob_grid(
+        self, theta_grid: Tensor, context: Tensor, max_elements: int = 2**24
+    ) -> Tensor:
+        """Returns the log probability of every grid point for every context.
+
+        See `MultivariateGaussianMDN.log_prob_grid`.
+
+        Returns:
+            Tensor: log probabilities of shape (batch_size, num_points)
+        """
+        logits, means, scale_tril = self.get_mixture_components(context)
+        batch_size, num_components, theta_dim = means.shape
+        # the triangular solve broadcasts the (D, D) Cholesky factors against
+        # every grid point, which dominates the intermediate tensors
+        elements_per_point = batch_size * num_components * theta_dim * theta_dim
+        chunk_size = max(1, max_elements // elements_per_point)
+
+        log_probs = []
+        for chunk in theta_grid.split(chunk_size):
+            log_probs.append(
+                mog_log_prob_cholesky(
+                    chunk.view(1, -1, theta_dim),
+                    logits.unsqueeze(1),
+                    means.unsqueeze(1),
+                    scale_tril.unsqueeze(1),
+                )
+            )
+
+        return torch.cat(log_probs, dim=1)
+
+
+def full_precision(tensor: Tensor) -> Tensor:
+    """Upcasts layer outputs computed under autocast to float32.
+
+    The mixture densities are evaluated from these outputs, and their
+    logsumexp over components needs more precision than bfloat16 offers.
+    """
+    if tensor.dtype in (torch.bfloat16, torch.float16):
+        return tensor.float()
+    return tensor
 
 
 def mog_log_prob(
@@ -79,7 +282,8 @@ def mog_log_prob(
     _, _, theta_dim = means.size()
     theta = theta.view(-1, 1, theta_dim)
 
-    log_cov_det = -0.5 * torch.log(torch.prod(variances, dim=2))
+    # sum of logs instead of log of the product, which under- or overflows
+    log_cov_det = -0.5 * torch.sum(torch.log(variances), dim=2)
 
     a = logits
     b = -(theta_dim / 2.0) * log(2 * pi)
@@ -92,23 +296,144 @@ def mog_log_prob(
     return torch.logsumexp(a + b + c + exponent, dim=-1)
 
 
-def mog_sample(logits: Tensor, means: Tensor, variances: Tensor) -> Tensor:
-    """Samples from a mixture of gaussians."""
+def mog_log_prob_from_log_variances(
+    theta: Tensor, logits: Tensor, means: Tensor, log_variances: Tensor
+) -> Tensor:
+    """Computes the log probability of theta under the mixture of gaussians.
+
+    Works directly on the log-variances: the log determinant is their sum and
+    the precisions are exp(-log_variances), both folded into a single
+    reduction over the features.
+    """
+    theta_dim = means.size(2)
+    diff = theta.view(-1, 1, theta_dim) - means
+    log_normal = -0.5 * torch.sum(
+        diff * diff * torch.exp(-log_variances) + log_variances, dim=2
+    )
+
+    # TorchScript only resolves the constants of the math module by attribute
+    log_2pi = math.log(2 * math.pi)
+    return torch.logsumexp(logits + log_normal - 0.5 * theta_dim * log_2pi, dim=-1)
+
+
+def mog_log_prob_grid(
+    theta_grid: Tensor,
+    logits: Tensor,
+    means: Tensor,
+    log_variances: Tensor,
+    max_elements: int = 2**24,
+) -> Tensor:
+    """Computes the log probability of every grid point under every mixture.
+
+    Broadcasts the (num_points, features) grid against the (batch_size, ...)
+    mixture parameters in chunks of grid points, such that the intermediate
+    tensors have at most max_elements elements.
+
+    Returns:
+        Tensor: log probabilities of shape (batch_size, num_points)
+    """
+    batch_size, num_components, theta_dim = means.shape
+    chunk_size = max(1, max_elements // (batch_size * num_components * theta_dim))
+
+    logits = logits.unsqueeze(1)
+    means = means.unsqueeze(1)
+    precisions = torch.exp(-log_variances).unsqueeze(1)
+    log_norm = logits - 0.5 * torch.sum(log_variances.unsqueeze(1), dim=-1)
+    log_norm = log_norm - 0.5 * theta_dim * log(2 * pi)
+
+    log_probs = []
+    for chunk in theta_grid.split(chunk_size):
+        diff = chunk.view(1, -1, 1, theta_dim) - means
+        exponent = -0.5 * torch.sum(diff * diff * precisions, dim=-1)
+        log_probs.append(torch.logsumexp(log_norm + exponent, dim=-1))
+
+    return torch.cat(log_probs, dim=1)
+
+
+def compile_mog_log_prob(method: str = "script"):
+    """Compiles `mog_log_prob_from_log_variances`.
+
+    Args:
+        method: "script" for TorchScript or "compile" for `torch.compile`.
+
+    Returns:
+        The compiled function with the same signature.
+    """
+    if method == "script":
+        return torch.jit.script(mog_log_prob_from_log_variances)
+    if method == "compile":
+        return torch.compile(mog_log_prob_from_log_variances, dynamic=True)
+    raise ValueError(f"Unknown method {method}, use 'script' or 'compile'.")
+
+
+def mog_log_prob_cholesky(
+    theta: Tensor, logits: Tensor, means: Tensor, scale_tril: Tensor
+) -> Tensor:
+    """Computes the log probability of theta under the full-covariance mixture.
+
+    The Mahalanobis distance is computed with a batched triangular solve and
+    the log determinant from the diagonal of the Cholesky factors, without
+    ever forming the covariances or their inverses. Leading dimensions of
+    theta (..., features) and of the mixture parameters (..., num_components,
+    ...) are broadcast.
+    """
+    theta_dim = means.size(-1)
+    diff = theta.unsqueeze(-2) - means
+    whitened = torch.linalg.solve_triangular(
+        scale_tril, diff.unsqueeze(-1), upper=False
+    ).squeeze(-1)
+    log_det = torch.sum(torch.log(torch.diagonal(scale_tril, dim1=-2, dim2=-1)), -1)
+    log_normal = -0.5 * torch.sum(whitened * whitened, dim=-1) - log_det
+
+    return torch.logsumexp(logits + log_normal - 0.5 * theta_dim * log(2 * pi), dim=-1)
+
+
+def mog_sample_cholesky(
+    logits: Tensor, means: Tensor, scale_tril: Tensor, num_samples: int
+) -> Tensor:
+    """Samples from a full-covariance mixture of gaussians.
+
+    Returns:
+        Tensor: samples of shape (batch_size, num_samples, features)
+    """
+    probs = F.softmax(logits, dim=-1)
+    choices = torch.multinomial(probs, num_samples=num_samples, replacement=True)
+
+    batch_idx = torch.arange(means.size(0), device=means.device).unsqueeze(1)
+    chosen_means = means[batch_idx, choices]
+    chosen_scale_tril = scale_tril[batch_idx, choices]
+
+    # correlate standard normal samples with the chosen Cholesky factors
+    standard_normal_sample = torch.randn_like(chosen_means).unsqueeze(-1)
+    return chosen_means + (chosen_scale_tril @ standard_normal_sample).squeeze(-1)
+
+
+def mog_sample(
+    logits: Tensor, means: Tensor, variances: Tensor, num_samples: int = None
+) -> Tensor:
+    """Samples from a mixture of gaussians.
+
+    Draws one sample per batch entry of shape (batch_size, features), or, if
+    num_samples is given, num_samples samples per batch entry of shape
+    (batch_size, num_samples, features) in one vectorized operation.
+    """
 
     # normalize the logits to be a valid probability distribution
     probs = F.softmax(logits, dim=-1)
 
     # choose a component index for each sample
-    choices = torch.multinomial(probs, num_samples=1, replacement=True).view(-1)
+    choices = torch.multinomial(probs, num_samples=num_samples or 1, replacement=True)
 
-    # select means and variances for the chosen components index?
-    chosen_means = means[range(means.size(0)), choices, :]
-    chosen_variances = variances[range(variances.size(0)), choices, :]
+    # select means and variances for the chosen components index
+    index = choices.unsqueeze(-1).expand(-1, -1, means.size(-1))
+    chosen_means = means.gather(1, index)
+    chosen_variances = variances.gather(1, index)
 
-    # sample from a standard normal and scale by the chosen variance
-    batch_size = means.shape[0]
-    standard_normal_sample = torch.randn(batch_size, 1)
+    # sample from a standard normal per feature and scale by the chosen variance
+    standard_normal_sample = torch.randn_like(chosen_means)
     zero_mean_samples = standard_normal_sample * torch.sqrt(chosen_variances)
     samples = chosen_means + zero_mean_samples
 
+    if num_samples is None:
+        return samples.squeeze(1)
     return samples
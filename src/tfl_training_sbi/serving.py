@@ -0,0 +1,240 @@
+"""In-process inference server that batches concurrent posterior queries."""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor, atleast_2d
+
+from .export import ExportableMDN
+from .mdn import (
+    FullCovarianceGaussianMDN,
+    MultivariateGaussianMDN,
+    mog_sample,
+    mog_sample_cholesky,
+)
+
+
+class PosteriorServer:
+    """Serve posterior samples by coalescing concurrent requests into batches."""
+
+    def __init__(
+        self,
+        posterior,
+        max_batch_size: int = 256,
+        max_delay: float = 0.002,
+        num_latencies: int = 10_000,
+    ):
+        """Serve posterior samples by coalescing concurrent requests into batches.
+
+        Requests from any number of threads are queued. A background thread
+        collects requests for at most `max_delay` seconds or until
+        `max_batch_size` requests are queued and answers them together. For
+        `MultivariateGaussianMDN` and `FullCovarianceGaussianMDN`, the hidden
+        network runs once for the whole batch of observations and exactly the
+        requested samples are drawn in one vectorized call. Models exported
+        with `export_mdn` are called with `sample(n, x)` once per distinct
+        number of samples n. Other posteriors, e.g. pickled sbi posteriors,
+        are called with `posterior.sample((n,), x=x)` per request.
+
+        Args:
+            posterior: `MultivariateGaussianMDN`, `FullCovarianceGaussianMDN`,
+            mdn exported with `export_mdn` or sbi posterior.
+            max_batch_size (int, optional): Maximal number of requests per
+            batch. Defaults to 256.
+            max_delay (float, optional): Maximal time in seconds the first
+            request of a batch waits for others. Defaults to 0.002.
+            num_latencies (int, optional): Number of most recent request
+            latencies the metrics are computed from. Defaults to 10_000.
+        """
+        self.posterior = posterior
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._latencies = deque(maxlen=num_latencies)
+        self._num_requests = 0
+        self._num_batches = 0
+        self._start_time = time.perf_counter()
+
+        self._worker = threading.Thread(target=self._serve, daemon=True)
+        self._worker.start()
+
+    def submit(self, x: Tensor, num_samples: int) -> Future:
+        """Queue a request without waiting for the result.
+
+        Args:
+            x (torch.Tensor): Single observation of shape (1, dim) or (dim,).
+            num_samples (int): Number of posterior samples.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the samples of shape
+            (num_samples, features).
+
+        Raises:
+            RuntimeError: If the server is closed.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit requests to a closed server.")
+            self._queue.put((atleast_2d(x), num_samples, future, time.perf_counter()))
+        return future
+
+    def sample(self, x: Tensor, num_samples: int) -> Tensor:
+        """Draw posterior samples, batched with concurrent requests.
+
+        Args:
+            x (torch.Tensor): Single observation of shape (1, dim) or (dim,).
+            num_samples (int): Number of posterior samples.
+
+        Returns:
+            torch.Tensor: Samples of shape (num_samples, features).
+        """
+        return self.submit(x, num_samples).result()
+
+    def metrics(self) -> Dict[str, float]:
+        """Throughput and latency of the answered requests.
+
+        Returns:
+            dict: Number of requests and batches, mean batch size, throughput
+            in requests per second since the start, and the p50 and p99
+            latency in seconds.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies)
+            num_requests, num_batches = self._num_requests, self._num_batches
+
+        return {
+            "requests": num_requests,
+            "batches": num_batches,
+            "mean_batch_size": num_requests / max(num_batches, 1),
+            "throughput": num_requests / (time.perf_counter() - self._start_time),
+            "p50_latency": float(np.percentile(latencies, 50)) if num_requests else 0.0,
+            "p99_latency": float(np.percentile(latencies, 99)) if num_requests else 0.0,
+        }
+
+    def close(self) -> None:
+        """Answer the queued requests and stop the background thread.
+
+        Requests the background thread did not answer fail with a
+        `RuntimeError`.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._worker.join()
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None and request[2].set_running_or_notify_cancel():
+                request[2].set_exception(RuntimeError("The server was closed."))
+
+    def __enter__(self) -> "PosteriorServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _serve(self) -> None:
+        """Collect requests into batches until `close` is called."""
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            batch = [request]
+            deadline = time.perf_counter() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.perf_counter(), 0.0)
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._answer(batch)
+                    return
+                batch.append(request)
+
+            self._answer(batch)
+
+    def _answer(self, batch: List[Tuple[Tensor, int, Future, float]]) -> None:
+        """Sample for a batch of requests and scatter the results."""
+        # cancelled requests are dropped, the others can no longer be cancelled
+        batch = [
+            request for request in batch if request[2].set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+
+        try:
+            self._answer_running(batch)
+        except Exception:
+            # answer one by one, so an invalid request only fails itself
+            for request in batch:
+                try:
+                    self._answer_running([request])
+                except Exception as error:
+                    request[2].set_exception(error)
+
+    def _answer_running(self, batch: List[Tuple[Tensor, int, Future, float]]) -> None:
+        """Sample for requests whose futures are running and set the results."""
+        results = self._sample_batch(
+            torch.cat([x for x, _, _, _ in batch]), [n for _, n, _, _ in batch]
+        )
+
+        end_time = time.perf_counter()
+        for (_, _, future, start_time), samples in zip(batch, results):
+            future.set_result(samples)
+        with self._lock:
+            self._latencies.extend(end_time - start for _, _, _, start in batch)
+            self._num_requests += len(batch)
+            self._num_batches += 1
+
+    @torch.no_grad()
+    def _sample_batch(self, x: Tensor, num_samples: List[int]) -> List[Tensor]:
+        """Samples for every observation in x, exactly as many as requested."""
+        if isinstance(self.posterior, MultivariateGaussianMDN):
+            logits, means, variances = self.posterior.get_mixture_components(x)
+            samples = mog_sample(*_per_sample(num_samples, logits, means, variances))
+            return list(samples.split(num_samples))
+
+        if isinstance(self.posterior, FullCovarianceGaussianMDN):
+            logits, means, scale_tril = self.posterior.get_mixture_components(x)
+            samples = mog_sample_cholesky(
+                *_per_sample(num_samples, logits, means, scale_tril), num_samples=1
+            )
+            return list(samples.squeeze(1).split(num_samples))
+
+        if isinstance(self.posterior, (torch.jit.ScriptModule, ExportableMDN)):
+            # sample(n, x) draws n samples per observation, so group by n
+            results: List[Tensor] = [None] * len(num_samples)
+            for n in set(num_samples):
+                idx = [i for i, n_i in enumerate(num_samples) if n_i == n]
+                for i, samples in zip(idx, self.posterior.sample(n, x[idx])):
+                    results[i] = samples
+            return results
+
+        # sbi posteriors take a single observation
+        return [
+            self.posterior.sample((n,), x=x_i.unsqueeze(0))
+            for x_i, n in zip(x, num_samples)
+        ]
+
+
+def _per_sample(num_samples: List[int], *params: Tensor) -> List[Tensor]:
+    """Repeat the mixture parameters of every observation once per sample."""
+    counts = torch.as_tensor(num_samples, device=params[0].device)
+    return [param.repeat_interleave(counts, dim=0) for param in params]
@@ -0,0 +1,178 @@
+"""Parallel generation of large simulation banks."""
+
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+from tqdm import tqdm
+
+from .data_utils import cast_for_storage
+from .utils_sir import eval_sir_model_batch
+
+
+def chunk_seed(seed: int, chunk_idx: int) -> int:
+    """Derive the seed of a chunk from the global seed and the chunk index.
+
+    The seed only depends on the position of the chunk in theta, not on the
+    worker that happens to process it, so results are reproducible for any
+    number of workers.
+
+    Args:
+        seed (int): Global seed.
+        chunk_idx (int): Index of the chunk.
+
+    Returns:
+        int: Seed for the chunk.
+    """
+    return int(np.random.SeedSequence([seed, chunk_idx]).generate_state(1)[0])
+
+
+def _open_output(output: dict) -> Tuple[np.ndarray, Optional[SharedMemory]]:
+    """Attach to the output array, either a memory-mapped .npy or shared memory."""
+    if output["path"] is not None:
+        return np.lib.format.open_memmap(output["path"], mode="r+"), None
+    shm = SharedMemory(name=output["shm_name"])
+    array = np.ndarray(output["shape"], dtype=output["dtype"], buffer=shm.buf)
+    return array, shm
+
+
+def _simulate_chunk(args: tuple) -> int:
+    """Simulate one chunk and write the result directly into the output array."""
+    simulator, theta_chunk, start, seed, output = args
+
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    x_chunk = simulator(theta_chunk)
+    if output["storage_dtype"] is not None:
+        x_chunk = torch.as_tensor(np.asarray(x_chunk))
+        x_chunk = cast_for_storage(x_chunk, output["storage_dtype"]).numpy()
+
+    x, shm = _open_output(output)
+    x[start : start + len(theta_chunk)] = x_chunk
+    if shm is None:
+        x.flush()
+    else:
+        del x
+        shm.close()
+
+    return len(theta_chunk)
+
+
+def simulate_parallel(
+    theta: np.ndarray,
+    n_workers: Optional[int] = None,
+    chunk_size: int = 10_000,
+    simulator: Callable[[np.ndarray], np.ndarray] = eval_sir_model_batch,
+    seed: int = 0,
+    base_path: Optional[str] = None,
+    file_name_thetas: str = "sir_thetas.npy",
+    file_name_x: str = "sir_x_obs.npy",
+    progress: bool = True,
+    dtype: Optional[torch.dtype] = None,
+    dtype_x: Optional[torch.dtype] = None,
+) -> Tuple[Tensor, Tensor]:
+    """Run the simulator on chunks of theta across a process pool.
+
+    Workers do not send their results back through pickling. Instead, every
+    worker writes its chunk directly into a shared output array: a
+    memory-mapped .npy file if `base_path` is given, otherwise a shared memory
+    block. Before each chunk, numpy and torch are seeded with `chunk_seed(seed,
+    chunk_idx)`, so stochastic simulators give the same result independent of
+    `n_workers`.
+
+    To allocate the output, the parent process first simulates `theta[:1]`
+    once to find the shape and dtype of x. This probe is discarded, is not
+    seeded with a chunk seed, and draws from the parent's global random state
+    if the simulator is stochastic.
+
+    If `base_path` is given, theta and x are stored such that
+    `load_sir_data(base_path, file_name_thetas, file_name_x)` loads them.
+    With `dtype`, the bank is written in a compact dtype once, so it can be
+    memory-mapped without any cast later.
+
+    Args:
+        theta (np.ndarray): Parameters of shape (N, 2).
+        n_workers (int, optional): Number of worker processes. Defaults to the
+        number of CPUs.
+        chunk_size (int, optional): Number of parameters per chunk. Defaults to
+        10_000.
+        simulator (Callable, optional): Batched simulator mapping parameters of
+        shape (n, 2) to an array of shape (n, ...). Must be picklable. Defaults
+        to `eval_sir_model_batch`.
+        seed (int, optional): Global seed for the per-chunk seeds. Defaults to 0.
+        base_path (str, optional): Directory to store the bank in. Defaults to
+        None, i.e. results are kept in memory only.
+        file_name_thetas (str, optional): Name of the file containing thetas.
+        file_name_x (str, optional): Name of the file containing the observations.
+        progress (bool, optional): Whether to show a progress bar. Defaults to
+        True.
+        dtype (torch.dtype, optional): dtype theta and x are stored in, see
+        `cast_for_storage`. Defaults to None, i.e. the dtype of theta and of
+        the simulator output.
+        dtype_x (torch.dtype, optional): dtype x is stored in if it differs
+        from `dtype`, e.g. torch.int16 for counts. Defaults to None.
+
+    Returns:
+        tuple: theta, x as tensors, like `load_sir_data`. If `base_path` is
+        given, x is backed by the memory-mapped file.
+    """
+    theta = cast_for_storage(torch.as_tensor(np.asarray(theta)), dtype).numpy()
+    n_workers = n_workers or os.cpu_count()
+    storage_dtype = dtype_x or dtype
+
+    # simulate a single parameter to find out the shape and dtype of the output
+    probe = torch.as_tensor(np.asarray(simulator(theta[:1])))
+    probe = cast_for_storage(probe, storage_dtype).numpy()
+    shape, out_dtype = (theta.shape[0],) + probe.shape[1:], probe.dtype
+
+    shm = None
+    if base_path is not None:
+        os.makedirs(base_path, exist_ok=True)
+        np.save(os.path.join(base_path, file_name_thetas), theta)
+        path = os.path.join(base_path, file_name_x)
+        np.lib.format.open_memmap(path, mode="w+", dtype=out_dtype, shape=shape).flush()
+        output = {"path": path, "storage_dtype": storage_dtype}
+    else:
+        shm = SharedMemory(
+            create=True, size=max(int(np.prod(shape)), 1) * out_dtype.itemsize
+        )
+        output = {
+            "path": None,
+            "shm_name": shm.name,
+            "shape": shape,
+            "dtype": out_dtype,
+            "storage_dtype": storage_dtype,
+        }
+
+    tasks = [
+        (
+            simulator,
+            theta[start : start + chunk_size],
+            start,
+            chunk_seed(seed, i),
+            output,
+        )
+        for i, start in enumerate(range(0, theta.shape[0], chunk_size))
+    ]
+
+    try:
+        with Pool(processes=n_workers) as pool, tqdm(
+            total=theta.shape[0], disable=not progress, desc="Simulating"
+        ) as pbar:
+            for num_done in pool.imap_unordered(_simulate_chunk, tasks):
+                pbar.update(num_done)
+
+        if shm is None:
+            x = np.lib.format.open_memmap(output["path"], mode="r+")
+        else:
+            x = np.ndarray(shape, dtype=out_dtype, buffer=shm.buf).copy()
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    return torch.from_numpy(theta), torch.from_numpy(x)
@@ -0,0 +1,301 @@
+"""Sharded on-disk simulation banks and streaming datasets over them."""
+
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor, atleast_2d
+from torch.utils.data import IterableDataset, get_worker_info
+from torchvision import transforms
+
+from .data_utils import cast_for_storage, load_sir_data
+
+
+class SimulationBank:
+    """Simulation bank stored as fixed-size shards of theta and x."""
+
+    manifest_file_name = "manifest.json"
+
+    def __init__(
+        self,
+        base_path: str,
+        shard_size: int = 100_000,
+        dtype_theta: Optional[torch.dtype] = torch.float32,
+        dtype_x: Optional[torch.dtype] = torch.float32,
+    ):
+        """Simulation bank stored as fixed-size shards of theta and x.
+
+        Every shard consists of a theta and an x .npy file in the format read
+        by `load_sir_data`. A small manifest keeps the number of samples, the
+        dtypes and the per-shard statistics, so new simulations can be
+        appended without touching full shards. Appended data first fills up
+        the last shard if it is partial and is cast to the storage dtypes with
+        `cast_for_storage`. An existing bank in `base_path` is opened, in
+        which case the other arguments are ignored.
+
+        Args:
+            base_path (str): Directory of the bank.
+            shard_size (int, optional): Number of samples per shard. Defaults
+            to 100_000.
+            dtype_theta (torch.dtype, optional): Storage dtype of theta. None
+            keeps the dtype of the first appended data. Defaults to
+            torch.float32.
+            dtype_x (torch.dtype, optional): Storage dtype of x, e.g.
+            torch.float16 or torch.int16 for counts. Defaults to torch.float32.
+        """
+        self.base_path = base_path
+        manifest_path = os.path.join(base_path, self.manifest_file_name)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                self.manifest = json.load(file)
+        else:
+            self.manifest = {
+                "shard_size": shard_size,
+                "dtype_theta": _numpy_dtype(dtype_theta),
+                "dtype_x": _numpy_dtype(dtype_x),
+                "shards": [],
+            }
+
+    @property
+    def shards(self) -> List[dict]:
+        """Manifest entries of the shards in the order they were written."""
+        return self.manifest["shards"]
+
+    def __len__(self) -> int:
+        """Total number of samples in the bank."""
+        return sum(shard["num_samples"] for shard in self.shards)
+
+    def append(self, theta: np.ndarray, x: np.ndarray) -> None:
+        """Write new simulations, filling up the last shard first.
+
+        Args:
+            theta (np.array or torch.Tensor): Parameters of shape (N, ...).
+            x (np.array or torch.Tensor): Observations of shape (N, ...).
+        """
+        if len(theta) != len(x):
+            raise ValueError("theta and x must have the same number of samples.")
+        theta, x = self._cast(theta, "dtype_theta"), self._cast(x, "dtype_x")
+
+        os.makedirs(self.base_path, exist_ok=True)
+        shard_size = self.manifest["shard_size"]
+        if self.shards and self.shards[-1]["num_samples"] < shard_size:
+            # rewrite the partial shard, so many small appends give full shards
+            shard = self.shards.pop()
+            theta = np.concatenate([self._load(shard["file_name_thetas"]), theta])
+            x = np.concatenate([self._load(shard["file_name_x"]), x])
+
+        for start in range(0, len(theta), shard_size):
+            idx = len(self.shards)
+            shard = {
+                "file_name_thetas": f"theta_{idx:05d}.npy",
+                "file_name_x": f"x_{idx:05d}.npy",
+                "num_samples": len(theta[start : start + shard_size]),
+            }
+            for name, file_key, value in (
+                ("theta", "file_name_thetas", theta[start : start + shard_size]),
+                ("x", "file_name_x", x[start : start + shard_size]),
+            ):
+                self._save(shard[file_key], value)
+                shard[f"mean_{name}"] = value.mean(axis=0).tolist()
+                shard[f"std_{name}"] = value.std(axis=0).tolist()
+            self.shards.append(shard)
+
+        # the manifest is written last, so readers never see partial shards
+        tmp_path = os.path.join(self.base_path, f"{self.manifest_file_name}.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self.manifest, file)
+        os.replace(tmp_path, os.path.join(self.base_path, self.manifest_file_name))
+
+    def _load(self, file_name: str) -> np.ndarray:
+        """Read a shard file as stored."""
+        return np.load(os.path.join(self.base_path, file_name))
+
+    def _save(self, file_name: str, value: np.ndarray) -> None:
+        """Write a shard file, replacing an existing one atomically."""
+        tmp_path = os.path.join(self.base_path, f"{file_name}.tmp")
+        with open(tmp_path, "wb") as file:
+            np.save(file, value)
+        os.replace(tmp_path, os.path.join(self.base_path, file_name))
+
+    def _cast(self, value: np.ndarray, key: str) -> np.ndarray:
+        """Cast to the storage dtype in the manifest, set it if it is missing."""
+        value = torch.as_tensor(np.asarray(value))
+        if self.manifest[key] is not None:
+            dtype = torch.from_numpy(np.empty(0, np.dtype(self.manifest[key]))).dtype
+            value = cast_for_storage(value, dtype)
+        value = value.numpy()
+        self.manifest[key] = value.dtype.str
+        return value
+
+    def load_shard(self, idx: int, mmap: bool = True) -> Tuple[Tensor, Tensor]:
+        """Load a single shard.
+
+        Args:
+            idx (int): Index of the shard.
+            mmap (bool, optional): Memory-map the files. Defaults to True.
+
+        Returns:
+            tuple: theta, x
+        """
+        shard = self.shards[idx]
+        return load_sir_data(
+            self.base_path, shard["file_name_thetas"], shard["file_name_x"], mmap=mmap
+        )
+
+    def load(self) -> Tuple[Tensor, Tensor]:
+        """Load the whole bank into memory, e.g. to create a `SIRSimulation`.
+
+        Returns:
+            tuple: theta, x
+        """
+        shards = [self.load_shard(idx, mmap=True) for idx in range(len(self.shards))]
+        return (
+            torch.cat([theta for theta, _ in shards]),
+            torch.cat([x for _, x in shards]),
+        )
+
+
+class ShardedSIRSimulation(IterableDataset):
+    """Streaming dataset over a `SimulationBank`."""
+
+    def __init__(
+        self,
+        bank: SimulationBank,
+        shuffle_buffer_size: int = 10_000,
+        shuffle: bool = True,
+        seed: int = 0,
+        transformations: transforms.Compose = None,
+        dtype: Optional[torch.dtype] = None,
+    ):
+        """Streaming dataset over a `SimulationBank`.
+
+        Yields the same items as `SIRSimulation`, but only ever holds one
+        memory-mapped shard and the shuffle buffer in memory. Shards are read
+        in a random order and split across `DataLoader` workers, and samples
+        are shuffled within a buffer of `shuffle_buffer_size` items. The
+        transformations are applied once per shard. Call `set_epoch` before
+        every epoch to get a different order.
+
+        Args:
+            bank (SimulationBank): Bank to stream from.
+            shuffle_buffer_size (int, optional): Size of the shuffle buffer.
+            Defaults to 10_000.
+            shuffle (bool, optional): Shuffle shards and samples. Defaults to
+            True.
+            seed (int, optional): Seed for the shuffling. Defaults to 0.
+            transformations (transforms.Compose, optional): Transformations.
+            dtype (torch.dtype, optional): dtype of the yielded items. Shards
+            are upcast to it after reading. Defaults to None, i.e. the storage
+            dtype of theta.
+        """
+        super().__init__()
+        self.bank = bank
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.transformations = transformations
+        self.dtype = dtype
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch, which changes the order of shards and samples.
+
+        Args:
+            epoch (int): Epoch.
+        """
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return len(self.bank)
+
+    def _shard_indices(self) -> List[int]:
+        """Shards read by the current worker."""
+        indices = np.arange(len(self.bank.shards))
+        if self.shuffle:
+            # the same permutation in every worker, so the split is disjoint
+            np.random.default_rng([self.seed, self.epoch]).shuffle(indices)
+
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            indices = indices[worker_info.id :: worker_info.num_workers]
+        return indices.tolist()
+
+    def _items(self, shard_indices: List[int]) -> Iterator[Dict[str, Tensor]]:
+        """Items of the shards in order, transformed once per shard."""
+        for idx in shard_indices:
+            theta, x = self.bank.load_shard(idx, mmap=True)
+            dtype = self.dtype or theta.dtype
+            data = {"theta": atleast_2d(theta.to(dtype)), "x": atleast_2d(x.to(dtype))}
+            if self.transformations:
+                data = self.transformations(data)
+            for i in range(len(data["theta"])):
+                yield {key: value[i : i + 1] for key, value in data.items()}
+
+    def __iter__(self) -> Iterator[Dict[str, Tensor]]:
+        """Iterate over the items of the worker's shards.
+
+        Yields:
+            dict: {"theta": theta, "x": x}
+        """
+        shard_indices = self._shard_indices()
+        items = self._items(shard_indices)
+        if not self.shuffle:
+            yield from items
+            return
+
+        worker_info = get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        rng = np.random.default_rng([self.seed, self.epoch, worker_id])
+
+        buffer: List[Dict[str, Tensor]] = []
+        for item in items:
+            # the items are views, which would keep their whole shard alive
+            item = {key: value.clone() for key, value in item.items()}
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(item)
+                continue
+            i = rng.integers(len(buffer))
+            yield buffer[i]
+            buffer[i] = item
+
+        rng.shuffle(buffer)
+        yield from buffer
+
+
+def bank_from_sir_data(
+    base_path: str,
+    bank_path: str,
+    shard_size: int = 100_000,
+    dtype_theta: Optional[torch.dtype] = torch.float32,
+    dtype_x: Optional[torch.dtype] = torch.float32,
+    **kwargs,
+) -> SimulationBank:
+    """Convert pre-generated data as read by `load_sir_data` into a bank.
+
+    Args:
+        base_path (str): Path to the data.
+        bank_path (str): Directory of the new bank.
+        shard_size (int, optional): Number of samples per shard. Defaults to
+        100_000.
+        dtype_theta (torch.dtype, optional): Storage dtype of theta, see
+        `SimulationBank`. Defaults to torch.float32.
+        dtype_x (torch.dtype, optional): Storage dtype of x. Defaults to
+        torch.float32.
+        **kwargs: Passed on to `load_sir_data`.
+
+    Returns:
+        SimulationBank: The new bank.
+    """
+    theta, x = load_sir_data(base_path, mmap=True, **kwargs)
+    bank = SimulationBank(bank_path, shard_size, dtype_theta, dtype_x)
+    bank.append(theta.numpy(), x.numpy())
+    return bank
+
+
+def _numpy_dtype(dtype: Optional[torch.dtype]) -> Optional[str]:
+    """String of the numpy dtype corresponding to a torch dtype."""
+    if dtype is None:
+        return None
+    return torch.empty(0, dtype=dtype).numpy().dtype.str
@@ -0,0 +1,157 @@
+"""Persistent, content-addressed cache for simulation results."""
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class SimulationCache:
+    """On-disk cache of simulation results with LRU eviction."""
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 1_000_000_000):
+        """On-disk cache of simulation results with LRU eviction.
+
+        Every result is stored as a single .npy file named after the hash of
+        the simulation inputs. The access order is kept in the modification
+        times of the files, so it survives restarts. When the total size of the
+        cache exceeds `max_size_bytes`, the least recently used entries are
+        deleted.
+
+        Args:
+            cache_dir (str): Directory to store the cached results in.
+            max_size_bytes (int, optional): Maximal total size of the cache.
+            Defaults to 1 GB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = [
+            entry for entry in os.scandir(cache_dir) if entry.name.endswith(".npy")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        # maps key -> file size, ordered from least to most recently used
+        self._index = OrderedDict(
+            (entry.name[: -len(".npy")], entry.stat().st_size) for entry in entries
+        )
+        self.size_bytes = sum(self._index.values())
+
+    @staticmethod
+    def key(
+        theta: np.ndarray,
+        initial_cond: tuple,
+        population_size: int,
+        grid_points: np.ndarray,
+        solver: str = "odeint",
+    ) -> str:
+        """Hash the inputs of a simulation.
+
+        Args:
+            theta (np.array): Input params beta and gamma.
+            initial_cond (tuple): Initial cond. S0, I0 and R0.
+            population_size (int): Population size.
+            grid_points (np.array): Grid point, i.e. time.
+            solver (str, optional): Identifier of the solver and its settings.
+            Defaults to "odeint".
+
+        Returns:
+            str: Hex digest identifying the simulation.
+        """
+        digest = hashlib.sha256(f"{len(solver)}:{solver}".encode())
+        for value in (theta, initial_cond, [population_size], grid_points):
+            value = np.ascontiguousarray(value, dtype=np.float64)
+            # the dtype and shape delimit the inputs, so the bytes of different
+            # splits, e.g. of theta and initial_cond, never hash alike
+            digest.update(f"{value.dtype.str}{value.shape}".encode())
+            digest.update(value.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Look up a result and mark it as most recently used.
+
+        Args:
+            key (str): Key as returned by `key`.
+
+        Returns:
+            np.array: The cached result or None if it is not in the cache.
+        """
+        if key in self._index:
+            try:
+                result = np.load(self._path(key))
+                os.utime(self._path(key))
+                self._index.move_to_end(key)
+                self.hits += 1
+                return result
+            except FileNotFoundError:
+                # evicted by another process sharing the cache directory
+                self.size_bytes -= self._index.pop(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: np.ndarray) -> None:
+        """Store a result and evict least recently used entries if necessary.
+
+        Args:
+            key (str): Key as returned by `key`.
+            result (np.array): Simulation result.
+        """
+        tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, result)
+        os.replace(tmp_path, self._path(key))
+
+        self.size_bytes -= self._index.pop(key, 0)
+        self._index[key] = os.path.getsize(self._path(key))
+        self.size_bytes += self._index[key]
+
+        while self.size_bytes > self.max_size_bytes and len(self._index) > 1:
+            oldest_key, size = self._index.popitem(last=False)
+            self.size_bytes -= size
+            try:
+                os.remove(self._path(oldest_key))
+            except FileNotFoundError:
+                pass
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Return the cached result or compute and store it.
+
+        Args:
+            key (str): Key as returned by `key`.
+            compute (Callable): Function computing the result on a cache miss.
+
+        Returns:
+            np.array: The simulation result.
+        """
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self) -> None:
+        """Remove all entries and reset the hit and miss counters."""
+        for key in self._index:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._index.clear()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Number of cached results.
+
+        Returns:
+            int: Number of cached results.
+        """
+        return len(self._index)
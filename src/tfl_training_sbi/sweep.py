@@ -0,0 +1,172 @@
+"""Parallel hyperparameter sweeps over mixture density network architectures."""
+
+import time
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch import Tensor
+
+from .data_utils import SIRSimulation
+from .mdn import MultivariateGaussianMDN
+from .training import fit
+
+# training data of the worker process, set once by _init_worker
+_worker_data = {}
+
+
+def build_mdn(
+    features: int,
+    context_features: int,
+    num_components: int,
+    hidden_features: Sequence[int],
+) -> MultivariateGaussianMDN:
+    """Build an mdn with a fully connected ReLU hidden net.
+
+    Args:
+        features (int): Dimension of theta.
+        context_features (int): Dimension of x.
+        num_components (int): Number of mixture components.
+        hidden_features (sequence): Width of every hidden layer, e.g.
+        (32, 32, 16) as in nb_03.
+
+    Returns:
+        MultivariateGaussianMDN: The untrained mdn.
+    """
+    layers = []
+    for in_features, out_features in zip(
+        [context_features, *hidden_features], hidden_features
+    ):
+        layers += [nn.Linear(in_features, out_features), nn.ReLU()]
+
+    return MultivariateGaussianMDN(
+        features=features,
+        hidden_net=nn.Sequential(*layers),
+        num_components=num_components,
+        hidden_features=hidden_features[-1],
+    )
+
+
+def _init_worker(theta: Tensor, x: Tensor, num_threads: int) -> None:
+    """Keep the shared training data and limit the threads of a worker."""
+    torch.set_num_threads(num_threads)
+    _worker_data["theta"], _worker_data["x"] = theta, x
+
+
+def _run_config(args: tuple) -> dict:
+    """Train and evaluate a single configuration in a worker."""
+    config, fit_kwargs, seed, num_samples = args
+    theta, x = _worker_data["theta"], _worker_data["x"]
+
+    torch.manual_seed(seed)
+    mdn = build_mdn(
+        theta.shape[1], x.shape[1], config["num_components"], config["hidden_features"]
+    )
+    dataset = SIRSimulation(theta, x, simulator_lag=0.0)
+
+    start_time = time.perf_counter()
+    history = fit(mdn, dataset, seed=seed, progress=False, **fit_kwargs)
+    train_seconds = time.perf_counter() - start_time
+
+    latencies = []
+    with torch.no_grad():
+        for _ in range(50):
+            start_time = time.perf_counter()
+            mdn.sample(num_samples, x[:1])
+            latencies.append(time.perf_counter() - start_time)
+
+    return {
+        **config,
+        "num_parameters": sum(p.numel() for p in mdn.parameters()),
+        "validation_log_prob": -min(history["validation_loss"]),
+        "epochs": len(history["validation_loss"]),
+        "train_seconds": train_seconds,
+        "inference_latency_ms": 1e3 * float(np.median(latencies)),
+    }
+
+
+def sweep(
+    configs: List[dict],
+    theta: Tensor,
+    x: Tensor,
+    num_workers: int = 4,
+    threads_per_worker: int = 1,
+    seed: int = 0,
+    num_samples: int = 1_000,
+    **fit_kwargs,
+) -> pd.DataFrame:
+    """Train mdn configurations concurrently in a process pool.
+
+    theta and x are copied into shared memory once and handed to every
+    worker when it starts, so the workers do not hold copies of the training
+    data. The caller's tensors are left as they are, tensors that already are
+    in shared memory are not copied. Pass them in the dtype of the models,
+    usually float32, since a cast would copy them.
+
+    Args:
+        configs (list): Configurations as dicts with "num_components" and
+        "hidden_features", see `build_mdn`.
+        theta (torch.Tensor): Parameters of shape (N, features).
+        x (torch.Tensor): Observations of shape (N, context_features).
+        num_workers (int, optional): Number of worker processes. Defaults to
+        4.
+        threads_per_worker (int, optional): Number of torch threads per
+        worker. Defaults to 1.
+        seed (int, optional): Seed for initialization and training of every
+        configuration. Defaults to 0.
+        num_samples (int, optional): Number of posterior samples per call when
+        measuring the inference latency. Defaults to 1_000.
+        **fit_kwargs: Passed on to `fit`.
+
+    Returns:
+        pd.DataFrame: One row per configuration with the number of
+        parameters, the best validation log-prob per sample, the number of
+        epochs, the training time and the median latency of sampling
+        posterior samples for a single observation.
+    """
+    # share copies, share_memory_ would move the caller's tensors in place
+    theta, x = (
+        value if value.is_shared() else value.clone().share_memory_()
+        for value in (theta, x)
+    )
+
+    with mp.get_context("spawn").Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(theta, x, threads_per_worker),
+    ) as pool:
+        results = pool.map(
+            _run_config,
+            [(config, fit_kwargs, seed, num_samples) for config in configs],
+            chunksize=1,
+        )
+
+    return pd.DataFrame(results)
+
+
+def select_cheapest(
+    results: pd.DataFrame,
+    min_validation_log_prob: float,
+    cost: str = "inference_latency_ms",
+) -> pd.Series:
+    """Pick the cheapest configuration that meets an accuracy target.
+
+    Args:
+        results (pd.DataFrame): Results of `sweep`.
+        min_validation_log_prob (float): Accuracy target.
+        cost (str, optional): Column to minimize. Defaults to
+        "inference_latency_ms".
+
+    Returns:
+        pd.Series: Row of the selected configuration.
+
+    Raises:
+        ValueError: If no configuration meets the target.
+    """
+    candidates = results[results["validation_log_prob"] >= min_validation_log_prob]
+    if candidates.empty:
+        raise ValueError("No configuration meets the accuracy target.")
+    return candidates.loc[candidates[cost].idxmin()]
@@ -0,0 +1,357 @@
+"""Training of mixture density networks by maximum likelihood."""
+
+import copy
+import os
+import socket
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch import Tensor
+from torch.utils.data import (
+    DataLoader,
+    Dataset,
+    DistributedSampler,
+    Subset,
+    random_split,
+)
+from tqdm import trange
+
+from .data_utils import collate_sir_batch
+
+
+def unpack_batch(batch) -> Tuple[Tensor, Tensor]:
+    """Get theta and x of shape (batch_size, dim) from a batch.
+
+    Args:
+        batch (dict or tuple): {"theta": theta, "x": x} as returned for a
+        `SIRSimulation`, or (theta, x) as returned for a `TensorDataset`.
+
+    Returns:
+        tuple: theta, x
+    """
+    theta, x = (batch["theta"], batch["x"]) if isinstance(batch, dict) else batch
+    return theta.reshape(len(theta), -1), x.reshape(len(x), -1)
+
+
+def fit(
+    mdn: nn.Module,
+    dataset: Dataset,
+    batch_size: int = 1024,
+    max_epochs: int = 100,
+    learning_rate: float = 1e-3,
+    validation_fraction: float = 0.1,
+    patience: int = 10,
+    num_workers: int = 0,
+    num_threads: Optional[int] = None,
+    compile_loss: bool = False,
+    mixed_precision: bool = False,
+    checkpoint_path: Optional[str] = None,
+    seed: int = 0,
+    progress: bool = True,
+) -> Dict[str, List[float]]:
+    """Train an mdn by minimizing the negative log-likelihood of theta given x.
+
+    A fraction of the dataset is held out for validation, and training stops
+    once the validation loss did not improve for `patience` epochs. The
+    parameters of the best epoch are restored at the end. Losses are summed on
+    the device and only read once per epoch, so no step waits for a sync.
+    If `checkpoint_path` is given, the state is saved after every epoch and
+    training resumes from it when the file exists.
+
+    Args:
+        mdn (nn.Module): Model with `log_prob(theta, context)`, e.g. a
+        `MultivariateGaussianMDN`.
+        dataset (Dataset): Dataset of theta and x, e.g. a `SIRSimulation` or
+        a `TensorDataset`.
+        batch_size (int, optional): Batch size. Defaults to 1024.
+        max_epochs (int, optional): Maximal number of epochs. Defaults to 100.
+        learning_rate (float, optional): Learning rate of Adam. Defaults to
+        1e-3.
+        validation_fraction (float, optional): Fraction of the dataset used
+        for validation. Defaults to 0.1.
+        patience (int, optional): Number of epochs without improvement of the
+        validation loss before stopping. Defaults to 10.
+        num_workers (int, optional): Number of `DataLoader` workers that
+        prefetch batches. Defaults to 0.
+        num_threads (int, optional): Number of threads torch uses for intra-op
+        parallelism during training. The previous number is restored
+        afterwards. Defaults to None, i.e. torch's current setting.
+        compile_loss (bool, optional): Compile the loss with `torch.compile`.
+        Defaults to False.
+        mixed_precision (bool, optional): Run the forward pass under bfloat16
+        autocast. The mdn evaluates the mixture densities in float32.
+        Defaults to False.
+        checkpoint_path (str, optional): File to save checkpoints to and
+        resume from. Defaults to None.
+        seed (int, optional): Seed for the split and the shuffling. Defaults
+        to 0.
+        progress (bool, optional): Show a progress bar. Defaults to True.
+
+    Returns:
+        dict: Per epoch "train_loss", "validation_loss" and
+        "samples_per_second" of the training.
+    """
+    previous_num_threads = torch.get_num_threads()
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    try:
+        return _train(
+            mdn,
+            dataset,
+            batch_size=batch_size,
+            max_epochs=max_epochs,
+            learning_rate=learning_rate,
+            validation_fraction=validation_fraction,
+            patience=patience,
+            num_workers=num_workers,
+            compile_loss=compile_loss,
+            mixed_precision=mixed_precision,
+            checkpoint_path=checkpoint_path,
+            seed=seed,
+            progress=progress,
+        )
+    finally:
+        torch.set_num_threads(previous_num_threads)
+
+
+def fit_distributed(
+    mdn: nn.Module,
+    dataset: Dataset,
+    num_processes: int = 4,
+    threads_per_process: int = 1,
+    **kwargs,
+) -> Dict[str, List[float]]:
+    """Train an mdn data-parallel in several CPU processes.
+
+    Every process trains a replica of the mdn on its own shard of the
+    training data. After every backward pass, the gradients are averaged
+    across processes with an all-reduce over the gloo backend, so all
+    replicas take identical steps. Losses and the early stopping decision
+    are also aggregated across processes. `batch_size` is per process.
+
+    Args:
+        mdn (nn.Module): Model with `log_prob(theta, context)`. It is updated
+        with the trained parameters.
+        dataset (Dataset): Dataset of theta and x.
+        num_processes (int, optional): Number of processes. Defaults to 4.
+        threads_per_process (int, optional): Number of torch threads per
+        process. Defaults to 1.
+        **kwargs: Passed on to `fit`, except `num_threads`.
+
+    Returns:
+        dict: Per epoch "train_loss", "validation_loss" and
+        "samples_per_second" of all processes together.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = os.path.join(tmp_dir, "result.pt")
+        mp.spawn(
+            _train_process,
+            args=(
+                num_processes,
+                port,
+                threads_per_process,
+                mdn,
+                dataset,
+                kwargs,
+                result_path,
+            ),
+            nprocs=num_processes,
+        )
+        result = torch.load(result_path)
+
+    mdn.load_state_dict(result["model"])
+    return result["history"]
+
+
+def _train_process(
+    rank: int,
+    world_size: int,
+    port: int,
+    num_threads: int,
+    mdn: nn.Module,
+    dataset: Dataset,
+    kwargs: dict,
+    result_path: str,
+) -> None:
+    """Entry point of the processes started by `fit_distributed`."""
+    previous_num_threads = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    dist.init_process_group(
+        "gloo",
+        init_method=f"tcp://127.0.0.1:{port}",
+        rank=rank,
+        world_size=world_size,
+    )
+    try:
+        history = _train(mdn, dataset, rank=rank, world_size=world_size, **kwargs)
+        if rank == 0:
+            torch.save({"model": mdn.state_dict(), "history": history}, result_path)
+    finally:
+        dist.destroy_process_group()
+        torch.set_num_threads(previous_num_threads)
+
+
+def _all_reduce(*values: Tensor) -> List[float]:
+    """Sum scalars across processes with a single all-reduce."""
+    values = torch.tensor([float(value) for value in values], dtype=torch.float64)
+    dist.all_reduce(values)
+    return values.tolist()
+
+
+def _train(
+    mdn: nn.Module,
+    dataset: Dataset,
+    batch_size: int = 1024,
+    max_epochs: int = 100,
+    learning_rate: float = 1e-3,
+    validation_fraction: float = 0.1,
+    patience: int = 10,
+    num_workers: int = 0,
+    compile_loss: bool = False,
+    mixed_precision: bool = False,
+    checkpoint_path: Optional[str] = None,
+    seed: int = 0,
+    progress: bool = True,
+    rank: int = 0,
+    world_size: int = 1,
+) -> Dict[str, List[float]]:
+    """Training loop of `fit`, run by every process of `fit_distributed`."""
+    num_validation = max(1, int(validation_fraction * len(dataset)))
+    train_set, validation_set = random_split(
+        dataset,
+        [len(dataset) - num_validation, num_validation],
+        generator=torch.Generator().manual_seed(seed),
+    )
+    # shards the data across processes, the whole data for a single process
+    train_sampler = DistributedSampler(
+        train_set, num_replicas=world_size, rank=rank, shuffle=True, seed=seed
+    )
+    # without the padding of DistributedSampler, which would count repeated
+    # samples twice in the validation loss
+    validation_set = Subset(
+        validation_set, range(rank, len(validation_set), world_size)
+    )
+    loader_kwargs = dict(
+        batch_size=batch_size,
+        collate_fn=collate_sir_batch,
+        num_workers=num_workers,
+        persistent_workers=num_workers > 0,
+    )
+    train_loader = DataLoader(train_set, sampler=train_sampler, **loader_kwargs)
+    validation_loader = DataLoader(validation_set, **loader_kwargs)
+
+    device_type = next(mdn.parameters()).device.type
+
+    def loss_fn(theta: Tensor, x: Tensor) -> Tensor:
+        with torch.autocast(device_type, dtype=torch.bfloat16, enabled=mixed_precision):
+            return -mdn.log_prob(theta, x).sum()
+
+    if compile_loss:
+        loss_fn = torch.compile(loss_fn)
+
+    optimizer = torch.optim.Adam(mdn.parameters(), lr=learning_rate)
+    history = {"train_loss": [], "validation_loss": [], "samples_per_second": []}
+    best_loss, best_state, epochs_without_improvement = float("inf"), None, 0
+    start_epoch = 0
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path)
+        mdn.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        history = checkpoint["history"]
+        best_loss, best_state = checkpoint["best_loss"], checkpoint["best_state"]
+        epochs_without_improvement = checkpoint["epochs_without_improvement"]
+        start_epoch = checkpoint["epoch"] + 1
+
+    epochs = trange(start_epoch, max_epochs, disable=not progress or rank > 0)
+    for epoch in epochs:
+        if epochs_without_improvement >= patience:
+            break
+
+        # the order only depends on the epoch, also after resuming
+        train_sampler.set_epoch(epoch)
+        mdn.train()
+        start_time = time.perf_counter()
+        # summed on the device of the model, read once per epoch
+        train_loss, num_trained = 0.0, 0
+        for batch in train_loader:
+            theta, x = unpack_batch(batch)
+            loss = loss_fn(theta, x)
+            optimizer.zero_grad()
+            (loss / len(theta)).backward()
+            if world_size > 1:
+                _average_gradients(mdn, world_size)
+            optimizer.step()
+            train_loss = train_loss + loss.detach()
+            num_trained += len(theta)
+        elapsed = time.perf_counter() - start_time
+
+        mdn.eval()
+        validation_loss, num_validated = 0.0, 0
+        with torch.no_grad():
+            for batch in validation_loader:
+                theta, x = unpack_batch(batch)
+                validation_loss = validation_loss + loss_fn(theta, x)
+                num_validated += len(theta)
+
+        if world_size > 1:
+            train_loss, num_trained, validation_loss, num_validated = _all_reduce(
+                train_loss, num_trained, validation_loss, num_validated
+            )
+        history["train_loss"].append(float(train_loss) / num_trained)
+        history["validation_loss"].append(float(validation_loss) / num_validated)
+        history["samples_per_second"].append(num_trained / elapsed)
+        epochs.set_postfix(
+            validation_loss=history["validation_loss"][-1],
+            samples_per_second=history["samples_per_second"][-1],
+        )
+
+        if history["validation_loss"][-1] < best_loss:
+            best_loss = history["validation_loss"][-1]
+            best_state = copy.deepcopy(mdn.state_dict())
+            epochs_without_improvement = 0
+        else:
+            epochs_without_improvement += 1
+
+        if checkpoint_path is not None and rank == 0:
+            checkpoint = {
+                "model": mdn.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "history": history,
+                "best_loss": best_loss,
+                "best_state": best_state,
+                "epochs_without_improvement": epochs_without_improvement,
+                "epoch": epoch,
+            }
+            torch.save(checkpoint, f"{checkpoint_path}.tmp")
+            os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+    if best_state is not None:
+        mdn.load_state_dict(best_state)
+
+    return history
+
+
+def _average_gradients(mdn: nn.Module, world_size: int) -> None:
+    """Average the gradients across processes with a single all-reduce."""
+    params = [p for p in mdn.parameters() if p.requires_grad]
+    for p in params:
+        # missing gradients are zero, so every process reduces the same layout
+        if p.grad is None:
+            p.grad = torch.zeros_like(p)
+    grads = [p.grad for p in params]
+    flat = torch.cat([grad.reshape(-1) for grad in grads])
+    dist.all_reduce(flat)
+    flat /= world_size
+    for grad, averaged in zip(grads, flat.split([grad.numel() for grad in grads])):
+        grad.copy_(averaged.view_as(grad))
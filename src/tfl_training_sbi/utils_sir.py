@@ -1,16 +1,110 @@
 """Utility functions for the SIR model. """
 
 
+from typing import Optional, Sequence, Union
+
 import numpy as np
 
 from scipy.integrate import odeint
 
+from .simulation_cache import SimulationCache
+
+
+class ObservationSpec:
+    """Select the observed quantities from SIR trajectories."""
+
+    aggregations = (None, "sum", "mean", "max")
+
+    def __init__(
+        self,
+        compartments: Union[int, Sequence[int]] = (0, 1, 2),
+        time_indices: Union[slice, Sequence[int]] = slice(None),
+        aggregation: Optional[str] = None,
+    ):
+        """Select the observed quantities from SIR trajectories.
+
+        Passing a spec to the simulators makes them store only the selected
+        time points instead of the full trajectory. E.g. the observations used
+        in the tutorial, every 16th time point of the I compartment, are
+        `ObservationSpec(compartments=1, time_indices=slice(None, None, 16))`.
+
+        Args:
+            compartments (int or sequence, optional): Compartments to keep,
+            where 0, 1, 2 are S, I, R. An int drops the compartment axis.
+            Defaults to (0, 1, 2).
+            time_indices (slice or sequence, optional): Indices of the grid
+            points to keep. Defaults to slice(None), i.e. all.
+            aggregation (str, optional): One of "sum", "mean" or "max" to
+            aggregate over the selected time points. Defaults to None.
+        """
+        if aggregation not in self.aggregations:
+            raise ValueError(
+                f"aggregation must be one of {self.aggregations}, got {aggregation}."
+            )
+        self.compartments = (
+            compartments if isinstance(compartments, int) else list(compartments)
+        )
+        self.time_indices = (
+            time_indices if isinstance(time_indices, slice) else list(time_indices)
+        )
+        self.aggregation = aggregation
+
+    def time_index(self, num_grid_points: int) -> np.array:
+        """Indices of the selected grid points.
+
+        Args:
+            num_grid_points (int): Number of grid points of the simulation.
+
+        Returns:
+            np.array: Indices into the grid points.
+        """
+        return np.arange(num_grid_points)[self.time_indices]
+
+    def reduce(self, x):
+        """Aggregate and select compartments of time-selected trajectories.
+
+        Args:
+            x (np.array or torch.Tensor): Trajectories at the selected time
+            points of shape (..., len(time_index), 3).
+
+        Returns:
+            np.array or torch.Tensor: The observations.
+        """
+        if self.aggregation == "max":
+            # torch's max returns values and indices, amax only the values
+            x = getattr(x, "amax", x.max)(-2)
+        elif self.aggregation is not None:
+            x = getattr(x, self.aggregation)(-2)
+        return x[..., self.compartments]
+
+    def __call__(self, trajectories):
+        """Compute the observations from full trajectories.
+
+        Args:
+            trajectories (np.array or torch.Tensor): Trajectories of shape
+            (..., len(grid_points), 3).
+
+        Returns:
+            np.array or torch.Tensor: The observations.
+        """
+        return self.reduce(
+            trajectories[..., self.time_index(trajectories.shape[-2]), :]
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"ObservationSpec(compartments={self.compartments}, "
+            f"time_indices={self.time_indices}, aggregation={self.aggregation})"
+        )
+
 
 def eval_sir_model(
     theta: np.array,
     initial_cond: tuple = (999, 1, 0),
     population_size: int = 1_000,
     grid_points: np.array = np.linspace(0, 160, 160),
+    cache: Optional[SimulationCache] = None,
+    observation: Optional[ObservationSpec] = None,
 ) -> np.array:
     """Evaluate the SIR model for given number of parameters.
 
@@ -20,11 +114,29 @@ def eval_sir_model(
         (999, 1, 0), i.e. (N-1, 1, 0).
         population_size (int, optional): Population size. Defaults to 1_000.
         grid_points (np.array, optional): Grid point, i.e. time. Defaults to np.linspace(0, 160, 160).
+        cache (SimulationCache, optional): Cache to look up and store the
+        result in. Defaults to None, i.e. no caching.
+        observation (ObservationSpec, optional): Observed quantities to return
+        instead of the full trajectory. Defaults to None.
 
     Returns:
         np.array: three dim. array of shape (grid_points.shape[0], 3) where the
-        order is SIR.
+        order is SIR, or the observations selected by `observation`.
     """
+    if cache is not None:
+        return cache.get_or_compute(
+            cache.key(
+                theta,
+                initial_cond,
+                population_size,
+                grid_points,
+                "odeint" if observation is None else f"odeint-{observation!r}",
+            ),
+            lambda: eval_sir_model(
+                theta, initial_cond, population_size, grid_points, None, observation
+            ),
+        )
+
     # unpack initial conditions and params passed to function
     S0, I0, R0, N = initial_cond[0], initial_cond[1], initial_cond[2], population_size
     beta, gamma = theta[0], theta[1]
@@ -41,6 +153,125 @@ def eval_sir_model(
     # vectorized initial cond.
     y0 = S0, I0, R0
 
+    if observation is None:
+        # integrate the SIR equations over the time / grid points
+        ret = odeint(deriv, y0, t, args=(N, beta, gamma))
+        return ret
+
+    # integrate only up to the observed grid points, starting at the first one
+    needed = observation.time_index(len(t))
+    stored = np.unique(needed)
+    offset = int(stored[0] > 0)
+    t_solve = np.concatenate([t[:offset], t[stored]])
+    ret = odeint(deriv, y0, t_solve, args=(N, beta, gamma))[offset:]
+    return observation.reduce(ret[np.searchsorted(stored, needed)])
+
+
+def eval_sir_model_batch(
+    theta: np.array,
+    initial_cond: tuple = (999, 1, 0),
+    population_size: int = 1_000,
+    grid_points: np.array = np.linspace(0, 160, 160),
+    num_substeps: int = 10,
+    cache: Optional[SimulationCache] = None,
+    observation: Optional[ObservationSpec] = None,
+) -> np.array:
+    """Evaluate the SIR model for a batch of parameters in one vectorized solve.
+
+    Instead of calling `odeint` once per parameter set, all parameter sets are
+    integrated jointly with a classical fixed-step Runge-Kutta scheme (RK4)
+    that operates on the whole batch at once. Each interval between two grid
+    points is split into `num_substeps` steps.
+
+    With the default settings (beta <= 2.5, gamma in [0.05, 0.25] and
+    `num_substeps=10`), the results deviate from `eval_sir_model` by less than
+    0.05 individuals, i.e. less than 5e-5 relative to the population size. The
+    error of RK4 shrinks with the fourth power of the step size, so doubling
+    `num_substeps` reduces it roughly 16-fold.
+
+    Args:
+        theta (np.array): Input params beta and gamma of shape (N, 2).
+        initial_cond (tuple, optional): Initial cond. S0, I0 and R0. Defaults to
+        (999, 1, 0), i.e. (N-1, 1, 0).
+        population_size (int, optional): Population size. Defaults to 1_000.
+        grid_points (np.array, optional): Grid point, i.e. time. Defaults to np.linspace(0, 160, 160).
+        num_substeps (int, optional): Number of RK4 steps between two grid
+        points. Defaults to 10.
+        cache (SimulationCache, optional): Cache to look up and store the
+        results in, one entry per parameter set. Only the cache misses are
+        simulated. Defaults to None, i.e. no caching.
+        observation (ObservationSpec, optional): Observed quantities to return
+        instead of the full trajectories. Only the selected time points are
+        stored and the integration stops at the last of them. Defaults to None.
+
+    Returns:
+        np.array: array of shape (N, grid_points.shape[0], 3) where the order of
+        the last dimension is SIR, or the observations selected by
+        `observation` with a leading batch dimension.
+    """
+    theta = np.atleast_2d(np.asarray(theta, dtype=np.float64))
+
+    if cache is not None:
+        solver = f"rk4-{num_substeps}"
+        if observation is not None:
+            solver += f"-{observation!r}"
+        keys = [
+            cache.key(theta_i, initial_cond, population_size, grid_points, solver)
+            for theta_i in theta
+        ]
+        cached = [cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(cached) if result is None]
+        if missing:
+            simulated = eval_sir_model_batch(
+                theta[missing],
+                initial_cond,
+                population_size,
+                grid_points,
+                num_substeps,
+                observation=observation,
+            )
+            for i, result in zip(missing, simulated):
+                cache.put(keys[i], result)
+                cached[i] = result
+        return np.stack(cached)
+
+    beta, gamma = theta[:, 0], theta[:, 1]
+    t = np.asarray(grid_points, dtype=np.float64)
+
+    # only the observed grid points are stored
+    if observation is None:
+        stored = np.arange(t.shape[0])
+    else:
+        needed = observation.time_index(t.shape[0])
+        stored = np.unique(needed)
+
+    # one row of (S, I, R) per parameter set
+    y = np.empty((theta.shape[0], 3))
+    y[:] = initial_cond
+    ret = np.empty((theta.shape[0], stored.shape[0], 3))
+    num_stored = 0
+    if stored[0] == 0:
+        ret[:, 0] = y
+        num_stored = 1
+
+    # define diff. eq. of SIR model, vectorized over the batch axis
+    def deriv(y):
+        infections = beta * y[:, 0] * y[:, 1] / population_size
+        recoveries = gamma * y[:, 1]
+        return np.stack((-infections, infections - recoveries, recoveries), axis=-1)
+
     # integrate the SIR equations over the time / grid points
-    ret = odeint(deriv, y0, t, args=(N, beta, gamma))
-    return ret
+    for i, dt in enumerate(np.diff(t[: stored[-1] + 1]) / num_substeps, start=1):
+        for _ in range(num_substeps):
+            k1 = deriv(y)
+            k2 = deriv(y + 0.5 * dt * k1)
+            k3 = deriv(y + 0.5 * dt * k2)
+            k4 = deriv(y + dt * k3)
+            y = y + dt / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+        if stored[num_stored] == i:
+            ret[:, num_stored] = y
+            num_stored += 1
+
+    if observation is None:
+        return ret
+    return observation.reduce(ret[:, np.searchsorted(stored, needed)])
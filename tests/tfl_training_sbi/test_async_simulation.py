@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+import torch
+from tfl_training_sbi.async_simulation import AsyncSimulator
+from tfl_training_sbi.data_utils import SIRSimulation
+
+
+def test_async_simulator_coalescesRequests():
+    theta = torch.arange(100, dtype=torch.float64).reshape(50, 2)
+    simulation = SIRSimulation(theta, theta.sum(dim=1, keepdim=True), simulator_lag=0.1)
+    calls = []
+
+    def simulator(num_samples):
+        calls.append(num_samples)
+        return simulation(num_samples)
+
+    with AsyncSimulator(simulator, max_batch_size=16, max_delay=0.01) as sim:
+        start = time.perf_counter()
+        theta_out, x_out = asyncio.run(sim.simulate_many(40))
+        elapsed = time.perf_counter() - start
+
+    assert theta_out.shape == (40, 2)
+    torch.testing.assert_close(x_out, theta_out.sum(dim=1, keepdim=True))
+    assert sum(calls) == 40 and len(calls) < 40
+    # three batches run concurrently instead of 40 serial lags of 0.1 s
+    assert elapsed < 1.0
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+from typing import List
+
+import numpy as np
+import pytest
+import torch
+from tfl_training_sbi.data_utils import (
+    SIRSimulation,
+    SIRStdScaler,
+    collate_sir_batch,
+    load_sir_data,
+)
+from torch import atleast_2d
+from torch.utils.data import DataLoader
+from torchvision.transforms import Compose
+
+
+def make_simulation(**kwargs) -> SIRSimulation:
+    theta = torch.rand(100, 2, dtype=torch.float64)
+    x = torch.rand(100, 10, dtype=torch.float64) * 100
+    return SIRSimulation(
+        theta, x, simulator_lag=0.0, transformations=Compose([SIRStdScaler()]), **kwargs
+    )
+
+
+def test_sir_simulation_getitems_defaultCollateMatchesPerItem():
+    simulation = make_simulation()
+    indices = [3, 17, 42, 99]
+
+    batch = next(iter(DataLoader(simulation, batch_size=4, sampler=indices)))
+    expected = [simulation[i] for i in indices]
+
+    for key in ("theta", "x"):
+        torch.testing.assert_close(
+            batch[key], torch.stack([item[key] for item in expected])
+        )
+
+
+def test_sir_simulation_getitems_collateSirBatch():
+    simulation = make_simulation()
+    indices = [3, 17, 42, 99]
+
+    batch = next(
+        iter(
+            DataLoader(
+                simulation, batch_size=4, sampler=indices, collate_fn=collate_sir_batch
+            )
+        )
+    )
+
+    assert batch["theta"].shape == (4, 2)
+    assert batch["x"].shape == (4, 10)
+    torch.testing.assert_close(batch["x"], simulation[indices]["x"])
+
+
+def test_load_sir_data_mmap_copyOnWrite(tmp_path):
+    theta = np.random.rand(50, 2)
+    x = np.random.rand(50, 10)
+    np.save(tmp_path / "sir_thetas.npy", theta)
+    np.save(tmp_path / "sir_x_obs.npy", x)
+
+    theta_loaded, x_loaded = load_sir_data(str(tmp_path), mmap=True)
+    x_loaded[0] = -1.0
+
+    np.testing.assert_array_equal(theta_loaded.numpy(), theta)
+    np.testing.assert_array_equal(np.load(tmp_path / "sir_x_obs.npy"), x)
+
+    simulation = SIRSimulation(theta_loaded, x_loaded, simulator_lag=0.0)
+    np.testing.assert_array_equal(simulation[[1, 2]]["x"].numpy(), x[[1, 2]])
+    assert np.shares_memory(simulation.data_x.numpy(), x_loaded.numpy())
+
+    theta_compact, x_counts = load_sir_data(
+        str(tmp_path), mmap=True, dtype=torch.float32, dtype_x=torch.int16
+    )
+    assert theta_compact.dtype == torch.float32
+    assert x_counts.dtype == torch.int16
+
+    # read into memory, float64 files are stored in float32 unless asked for
+    theta_default, x_default = load_sir_data(str(tmp_path))
+    assert theta_default.dtype == x_default.dtype == torch.float32
+    np.testing.assert_allclose(x_default.numpy(), x, rtol=1e-6)
+    assert load_sir_data(str(tmp_path), dtype=torch.float64)[1].dtype == torch.float64
+
+
+def test_sir_std_scaler_fitStreaming_matchesFullDataAndRoundTrips(tmp_path):
+    theta = torch.rand(100, 2, dtype=torch.float64)
+    x = torch.rand(100, 10, dtype=torch.float64) * 100
+    chunks = [(theta[i : i + 30], x[i : i + 30]) for i in range(0, 100, 30)]
+
+    scaler = SIRStdScaler.fit_streaming(chunks)
+    scaler.save(str(tmp_path))
+    loaded = SIRStdScaler.load(str(tmp_path), inplace=True)
+
+    torch.testing.assert_close(scaler.mean_theta, theta.mean(dim=0).float())
+    torch.testing.assert_close(
+        scaler.std_theta, theta.std(dim=0, unbiased=False).float()
+    )
+    torch.testing.assert_close(scaler.mean_x, x.mean().reshape(1).float())
+    torch.testing.assert_close(loaded.std_x, scaler.std_x)
+
+    batch = {"theta": theta.clone(), "x": x.clone()}
+    expected = scaler(batch)
+    standardized = loaded(batch)
+    assert standardized["x"] is batch["x"]
+    torch.testing.assert_close(standardized["x"], expected["x"])
+    torch.testing.assert_close(loaded.rescale(standardized)["theta"], theta)
+
+
+def test_sir_simulation_inplaceScaler_doesNotModifyDataset():
+    theta = torch.rand(100, 2)
+    x = torch.rand(100, 10) * 100
+    scaler = SIRStdScaler(mean_x=torch.tensor([40.5]), inplace=True)
+    simulation = SIRSimulation(
+        theta.clone(), x.clone(), simulator_lag=0.0, transformations=scaler
+    )
+
+    for idx in (3, slice(10, 20), [3, 17]):
+        torch.testing.assert_close(
+            simulation[idx]["x"], atleast_2d((x[idx] - 40.5) / scaler.std_x)
+        )
+    torch.testing.assert_close(simulation.data_theta, theta)
+    torch.testing.assert_close(simulation.data_x, x)
+
+
+def test_sir_simulation_cacheTransformed_invalidatedOnParameterChange(tmp_path):
+    # own tensor, the default arguments are shared with the expected scaler
+    scaler = SIRStdScaler(mean_x=torch.tensor([40.5]), inplace=True)
+    theta = torch.rand(100, 2, dtype=torch.float64)
+    x = torch.rand(100, 10, dtype=torch.float64) * 100
+    x_orig = x.clone()
+    cached = SIRSimulation(
+        theta,
+        x,
+        simulator_lag=0.0,
+        transformations=Compose([scaler]),
+        cache_dir=str(tmp_path),
+    )
+    expected = SIRSimulation(
+        theta, x_orig, simulator_lag=0.0, transformations=Compose([SIRStdScaler()])
+    )
+
+    torch.testing.assert_close(cached[[1, 5]]["x"], expected[[1, 5]]["x"])
+    torch.testing.assert_close(cached[7]["theta"], expected[7]["theta"])
+    torch.testing.assert_close(x, x_orig)
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+    scaler.mean_x.add_(1.0)
+    torch.testing.assert_close(
+        cached[[1, 5]]["x"], expected[[1, 5]]["x"] - 1.0 / scaler.std_x
+    )
+    scaler.mean_x = scaler.mean_x + 1.0
+    torch.testing.assert_close(
+        cached[[1, 5]]["x"], expected[[1, 5]]["x"] - 2.0 / scaler.std_x
+    )
+    cached.transformations = expected.transformations
+    torch.testing.assert_close(cached[[1, 5]]["x"], expected[[1, 5]]["x"])
+
+
+def cached_file_names(cache_dir: str) -> List[str]:
+    torch.manual_seed(0)
+    make_simulation(cache_dir=cache_dir)[0]
+    return sorted(os.listdir(cache_dir))
+
+
+def test_sir_simulation_cacheDir_reusedAcrossProcesses(tmp_path):
+    file_names = cached_file_names(str(tmp_path))
+    # a fresh interpreter allocates the tensors of the scaler elsewhere
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        file_names_other_process = pool.apply(cached_file_names, (str(tmp_path),))
+
+    assert len(file_names) == 2
+    assert file_names_other_process == file_names
+
+
+def test_sir_simulation_simulateAt_nearestAndInterpolated():
+    theta = torch.tensor([[0.0, 0.1], [1.0, 0.1], [0.0, 0.2], [1.0, 0.2]])
+    x = torch.tensor([[0.0], [10.0], [20.0], [30.0]])
+    simulation = SIRSimulation(theta, x, simulator_lag=0.0)
+
+    x_nearest, distances = simulation.simulate_at(
+        torch.tensor([[0.9, 0.19], [0.0, 0.1]])
+    )
+    x_interpolated, _ = simulation.simulate_at(
+        torch.tensor([[0.5, 0.1]]), k=2, interpolate=True
+    )
+
+    torch.testing.assert_close(x_nearest, torch.tensor([[30.0], [0.0]]))
+    assert distances.shape == (2,) and distances[1] == 0
+    torch.testing.assert_close(x_interpolated, torch.tensor([[5.0]]))
+    query = torch.tensor([[0.9, 0.19]], requires_grad=True)
+    for theta_query in (query, query.detach().bfloat16()):
+        torch.testing.assert_close(
+            simulation.simulate_at(theta_query)[0], torch.tensor([[30.0]])
+        )
+    with pytest.raises(ValueError):
+        simulation.simulate_at(query, k=5)
+
+
+def test_sir_simulation_storageDtype_upcastAfterIndexing():
+    theta = torch.rand(100, 2, dtype=torch.float64)
+    x = torch.randint(0, 1000, (100, 10)).double()
+    simulation = SIRSimulation(
+        theta,
+        x,
+        simulator_lag=0.0,
+        storage_dtype=torch.float32,
+        storage_dtype_x=torch.int16,
+        dtype=torch.float64,
+    )
+
+    assert simulation.data_theta.dtype == torch.float32
+    assert simulation.data_x.dtype == torch.int16
+    assert simulation[[1, 2]]["x"].dtype == torch.float64
+    torch.testing.assert_close(simulation[[1, 2]]["x"], x[[1, 2]])
+    with pytest.raises(ValueError):
+        SIRSimulation(theta, x * 100, storage_dtype_x=torch.int8)
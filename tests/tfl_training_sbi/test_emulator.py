@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from tfl_training_sbi.emulator import SIREmulator
+from tfl_training_sbi.utils_sir import eval_sir_model_batch
+
+
+def test_sir_emulator_exactOnGridAndReloadable(tmp_path):
+    grid_points = np.linspace(0, 40, 40)
+    emulator = SIREmulator.build(
+        str(tmp_path), num_beta=11, num_gamma=5, grid_points=grid_points
+    )
+    theta = np.array([[0.0, 0.05], [0.5, 0.1], [2.5, 0.25]])
+
+    np.testing.assert_allclose(
+        emulator(theta), eval_sir_model_batch(theta, grid_points=grid_points)
+    )
+    reloaded = SIREmulator(str(tmp_path))
+    assert reloaded.max_validation_error == emulator.max_validation_error > 0
+    with pytest.raises(ValueError):
+        emulator(np.array([[3.0, 0.1]]))
@@ -0,0 +1,32 @@
+import torch
+import torch.nn as nn
+from tfl_training_sbi.data_utils import SIRStdScaler
+from tfl_training_sbi.export import export_mdn, load_mdn
+from tfl_training_sbi.mdn import MultivariateGaussianMDN
+
+
+def test_export_mdn_loadedMatchesEagerWithScalingFoldedIn(tmp_path):
+    torch.manual_seed(0)
+    mdn = MultivariateGaussianMDN(
+        features=2,
+        hidden_net=nn.Sequential(nn.Linear(10, 8), nn.ReLU()),
+        num_components=3,
+        hidden_features=8,
+    )
+    scaler = SIRStdScaler()
+    theta = torch.rand(5, 2) * torch.tensor([2.0, 0.2])
+    x = torch.rand(5, 10) * 100
+    path = str(tmp_path / "mdn.pt")
+
+    exported = export_mdn(mdn, path, scaler)
+    assert mdn.training and mdn._hidden_net.training
+    loaded = load_mdn(path)
+    scaled = scaler({"theta": theta, "x": x})
+    expected = mdn.log_prob(scaled["theta"], scaled["x"]) - scaler.std_theta.log().sum()
+
+    torch.testing.assert_close(loaded.log_prob(theta, x), expected)
+    torch.manual_seed(1)
+    samples = exported.sample(100, x)
+    torch.manual_seed(1)
+    torch.testing.assert_close(loaded.sample(100, x), samples)
+    assert samples.shape == (5, 100, 2)
@@ -0,0 +1,184 @@
+import copy
+import pickle
+
+import torch
+import torch.nn as nn
+from tfl_training_sbi.export import export_mdn, load_mdn
+from tfl_training_sbi.mdn import (
+    FullCovarianceGaussianMDN,
+    MultivariateGaussianMDN,
+    mog_log_prob,
+    mog_sample,
+)
+
+
+def make_mdn(features: int = 2, context_features: int = 3) -> MultivariateGaussianMDN:
+    return MultivariateGaussianMDN(
+        features=features,
+        hidden_net=nn.Sequential(nn.Linear(context_features, 8), nn.ReLU()),
+        num_components=3,
+        hidden_features=8,
+    )
+
+
+def test_mdn_sample_shapeAndMoments():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    context = torch.randn(2, 3)
+
+    samples = mdn.sample(20_000, context)
+    logits, means, variances = mdn.get_mixture_components(context)
+    weights = logits.exp().unsqueeze(-1)
+
+    assert samples.shape == (2, 20_000, 2)
+    torch.testing.assert_close(
+        samples.mean(dim=1), (weights * means).sum(dim=1), atol=0.05, rtol=0.0
+    )
+
+
+def test_mog_sample_independentNoisePerFeature():
+    torch.manual_seed(0)
+    logits = torch.zeros(1, 1)
+    means = torch.zeros(1, 1, 2)
+    variances = torch.ones(1, 1, 2)
+
+    samples = mog_sample(logits, means, variances, num_samples=10_000)[0]
+
+    assert mog_sample(logits, means, variances).shape == (1, 2)
+    assert abs(torch.corrcoef(samples.T)[0, 1]) < 0.05
+
+
+def test_mog_log_prob_fromLogVariances_matchesDistributionAndCompiled():
+    torch.manual_seed(0)
+    mdn = make_mdn(features=20)
+    theta, context = torch.randn(5, 20), torch.randn(5, 3)
+
+    logits, means, variances = mdn.get_mixture_components(context)
+    mixture = torch.distributions.MixtureSameFamily(
+        torch.distributions.Categorical(logits=logits),
+        torch.distributions.Independent(
+            torch.distributions.Normal(means, variances.sqrt()), 1
+        ),
+    )
+    expected = mixture.log_prob(theta)
+
+    torch.testing.assert_close(mog_log_prob(theta, logits, means, variances), expected)
+    torch.testing.assert_close(mdn.log_prob(theta, context), expected)
+    mdn.compile_log_prob("script")
+    torch.testing.assert_close(mdn.log_prob(theta, context), expected)
+
+
+def test_mdn_compiledLogProb_survivesPicklingAndDeepCopy(tmp_path):
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    theta, context = torch.randn(5, 2), torch.randn(5, 3)
+    expected = mdn.log_prob(theta, context)
+    mdn.compile_log_prob("script")
+
+    torch.save(mdn, tmp_path / "mdn.pt")
+    for copied in (
+        pickle.loads(pickle.dumps(mdn)),
+        copy.deepcopy(mdn),
+        torch.load(tmp_path / "mdn.pt"),
+    ):
+        assert isinstance(copied._log_prob_kernel, torch.jit.ScriptFunction)
+        torch.testing.assert_close(copied.log_prob(theta, context), expected)
+
+
+def test_mdn_log_prob_grid_matchesPointwiseAcrossChunks():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    theta_grid, context = torch.randn(7, 2), torch.randn(3, 3)
+
+    log_probs = mdn.log_prob_grid(theta_grid, context, max_elements=20)
+    expected = torch.stack(
+        [
+            mdn.log_prob(theta_grid, context_i.expand(len(theta_grid), -1))
+            for context_i in context
+        ]
+    )
+
+    assert log_probs.shape == (3, 7)
+    torch.testing.assert_close(log_probs, expected)
+
+
+def test_full_covariance_mdn_logProbSampleAndGrid():
+    torch.manual_seed(0)
+    mdn = FullCovarianceGaussianMDN(
+        features=3,
+        hidden_net=nn.Sequential(nn.Linear(2, 8), nn.ReLU()),
+        num_components=2,
+        hidden_features=8,
+    )
+    theta, context = torch.randn(4, 3), torch.randn(4, 2)
+
+    logits, means, scale_tril = mdn.get_mixture_components(context)
+    mixture = torch.distributions.MixtureSameFamily(
+        torch.distributions.Categorical(logits=logits),
+        torch.distributions.MultivariateNormal(means, scale_tril=scale_tril),
+    )
+    samples = mdn.sample(20_000, context[:1])
+
+    torch.testing.assert_close(mdn.log_prob(theta, context), mixture.log_prob(theta))
+    torch.testing.assert_close(
+        mdn.log_prob_grid(theta, context, max_elements=30),
+        mixture.log_prob(theta.unsqueeze(1)).T,
+    )
+    # law of total covariance
+    weights = logits[0].exp().view(-1, 1, 1)
+    component_means = means[0].unsqueeze(-1)
+    second_moment = (
+        scale_tril[0] @ scale_tril[0].mT + component_means @ component_means.mT
+    )
+    mean = mixture.mean[0]
+    covariance = (weights * second_moment).sum(0) - mean.outer(mean)
+
+    assert samples.shape == (1, 20_000, 3)
+    torch.testing.assert_close(
+        samples[0].T.cov(),
+        covariance.detach(),
+        atol=0.05 * covariance.abs().max().item(),
+        rtol=0.0,
+    )
+
+
+def test_mdn_quantize_reportsLogProbChangeAndExports(tmp_path):
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    theta, context = torch.randn(100, 2), torch.randn(100, 3)
+
+    quantized, report = mdn.quantize(theta, context, prune_amount=0.5)
+    path = str(tmp_path / "mdn.pt")
+    export_mdn(quantized, path)
+
+    assert abs(report["log_prob_change"]) <= report["abs_log_prob_change"] < 1.0
+    assert (quantized._means_layer.weight().dequantize() == 0).float().mean() >= 0.5
+    torch.testing.assert_close(
+        load_mdn(path).log_prob(theta, context), quantized.log_prob(theta, context)
+    )
+
+
+def test_mdn_quantize_afterCompilingLogProb():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    theta, context = torch.randn(100, 2), torch.randn(100, 3)
+    mdn.compile_log_prob("script")
+
+    quantized, report = mdn.quantize(theta, context)
+
+    assert isinstance(quantized._log_prob_kernel, torch.jit.ScriptFunction)
+    assert report["abs_log_prob_change"] < 1.0
+
+
+def test_mdn_mixedPrecision_logProbStaysFloat32WithBoundedDrift():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    theta, context = torch.randn(1_000, 2), torch.randn(1_000, 3)
+
+    expected = mdn.log_prob(theta, context)
+    with torch.autocast("cpu", dtype=torch.bfloat16):
+        log_prob = mdn.log_prob(theta, context)
+    samples = mdn.sample(10, context[:2], mixed_precision=True)
+
+    assert log_prob.dtype == samples.dtype == torch.float32
+    assert (log_prob - expected).abs().mean() < 0.05
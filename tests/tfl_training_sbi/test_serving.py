@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+import torch.nn as nn
+from tfl_training_sbi import serving
+from tfl_training_sbi.export import export_mdn, load_mdn
+from tfl_training_sbi.mdn import (
+    FullCovarianceGaussianMDN,
+    MultivariateGaussianMDN,
+    mog_sample,
+)
+from tfl_training_sbi.serving import PosteriorServer
+
+
+def make_mdn() -> MultivariateGaussianMDN:
+    return MultivariateGaussianMDN(
+        features=2,
+        hidden_net=nn.Sequential(nn.Linear(3, 8), nn.ReLU()),
+        num_components=3,
+        hidden_features=8,
+    )
+
+
+class ConstantPosterior:
+    """Stands in for an sbi posterior, which samples one observation at a time."""
+
+    def sample(self, sample_shape, x):
+        assert x.shape == (1, 3)
+        return x[:, :2].expand(*sample_shape, 2)
+
+
+def serve(posterior, x, num_samples):
+    with PosteriorServer(posterior, max_batch_size=len(x), max_delay=1.0) as server:
+        futures = [server.submit(x_i, n) for x_i, n in zip(x, num_samples)]
+        return [future.result() for future in futures], server.metrics()
+
+
+def test_posterior_server_coalescesConcurrentRequests():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    x = torch.randn(64, 3)
+
+    with PosteriorServer(mdn, max_batch_size=16, max_delay=0.05) as server:
+        futures = [server.submit(x_i, 10 + i) for i, x_i in enumerate(x)]
+        with ThreadPoolExecutor(4) as pool:
+            blocking = list(pool.map(lambda x_i: server.sample(x_i, 5), x[:8]))
+        samples = [future.result() for future in futures]
+        metrics = server.metrics()
+
+    assert [s.shape for s in samples] == [(10 + i, 2) for i in range(64)]
+    assert all(s.shape == (5, 2) for s in blocking)
+    assert metrics["requests"] == 72
+    assert metrics["batches"] < 72
+    assert 0 < metrics["p50_latency"] <= metrics["p99_latency"]
+
+
+def test_posterior_server_survivesCancelledAndInvalidRequests():
+    torch.manual_seed(0)
+    x = torch.randn(3, 3)
+
+    with PosteriorServer(make_mdn(), max_batch_size=8, max_delay=0.1) as server:
+        cancelled = server.submit(x[0], 5)
+        invalid = server.submit(torch.randn(4), 5)
+        valid = server.submit(x[1], 5)
+        assert cancelled.cancel()
+
+        with pytest.raises(RuntimeError):
+            invalid.result()
+        assert valid.result().shape == (5, 2)
+        assert server.sample(x[2], 3).shape == (3, 2)
+
+    with pytest.raises(RuntimeError):
+        server.submit(x[0], 5)
+
+
+def test_posterior_server_drawsExactlyTheRequestedSamples(monkeypatch):
+    drawn = []
+
+    def counting_mog_sample(logits, means, variances, num_samples=None):
+        drawn.append(len(logits) * (num_samples or 1))
+        return mog_sample(logits, means, variances, num_samples)
+
+    monkeypatch.setattr(serving, "mog_sample", counting_mog_sample)
+    samples, metrics = serve(make_mdn(), torch.randn(3, 3), [1, 500, 3])
+
+    assert [s.shape for s in samples] == [(1, 2), (500, 2), (3, 2)]
+    assert metrics["batches"] == 1
+    assert drawn == [504]
+
+
+@pytest.mark.parametrize("kind", ["full_covariance", "exported", "sbi"])
+def test_posterior_server_servesEveryKindOfPosterior(kind, tmp_path):
+    torch.manual_seed(0)
+    if kind == "full_covariance":
+        posterior = FullCovarianceGaussianMDN(
+            features=2,
+            hidden_net=nn.Sequential(nn.Linear(3, 8), nn.ReLU()),
+            num_components=3,
+            hidden_features=8,
+        )
+    elif kind == "exported":
+        export_mdn(make_mdn(), str(tmp_path / "mdn.pt"))
+        posterior = load_mdn(str(tmp_path / "mdn.pt"))
+    else:
+        posterior = ConstantPosterior()
+    x = torch.randn(4, 3)
+
+    samples, metrics = serve(posterior, x, [5, 2, 5, 1])
+
+    assert [s.shape for s in samples] == [(5, 2), (2, 2), (5, 2), (1, 2)]
+    assert metrics["requests"] == 4
+    assert all(torch.isfinite(s).all() for s in samples)
+    if kind == "sbi":
+        torch.testing.assert_close(samples[2], x[2, :2].expand(5, 2))
@@ -0,0 +1,61 @@
+import numpy as np
+import torch
+from tfl_training_sbi.data_utils import load_sir_data
+from tfl_training_sbi.simulation import simulate_parallel
+from tfl_training_sbi.utils_sir import eval_sir_model_batch
+
+
+def noisy_simulator(theta):
+    return theta + np.random.randn(*theta.shape)
+
+
+def test_simulate_parallel_matchesSerialSolve():
+    theta = np.stack([np.linspace(0.1, 2.0, 25), np.linspace(0.05, 0.25, 25)], axis=1)
+
+    theta_out, x = simulate_parallel(theta, n_workers=2, chunk_size=7, progress=False)
+
+    assert isinstance(x, torch.Tensor)
+    np.testing.assert_array_equal(theta_out.numpy(), theta)
+    np.testing.assert_allclose(x.numpy(), eval_sir_model_batch(theta))
+
+
+def test_simulate_parallel_writesLoadableBankWithDeterministicSeeds(tmp_path):
+    theta = np.random.rand(30, 2)
+
+    _, x = simulate_parallel(
+        theta,
+        n_workers=3,
+        chunk_size=4,
+        simulator=noisy_simulator,
+        base_path=str(tmp_path),
+        progress=False,
+    )
+    _, x_other_workers = simulate_parallel(
+        theta, n_workers=1, chunk_size=4, simulator=noisy_simulator, progress=False
+    )
+    theta_loaded, x_loaded = load_sir_data(str(tmp_path), dtype=torch.float64)
+
+    np.testing.assert_array_equal(x.numpy(), x_other_workers.numpy())
+    np.testing.assert_array_equal(x_loaded.numpy(), x.numpy())
+    np.testing.assert_array_equal(theta_loaded.numpy(), theta)
+
+
+def test_simulate_parallel_writesCompactDtype(tmp_path):
+    theta = np.stack([np.linspace(0.1, 2.0, 10), np.linspace(0.05, 0.25, 10)], axis=1)
+
+    _, x = simulate_parallel(
+        theta,
+        n_workers=2,
+        chunk_size=4,
+        base_path=str(tmp_path),
+        progress=False,
+        dtype=torch.float32,
+        dtype_x=torch.int16,
+    )
+    theta_loaded, x_loaded = load_sir_data(str(tmp_path), mmap=True)
+
+    assert theta_loaded.dtype == torch.float32
+    assert x_loaded.dtype == torch.int16
+    np.testing.assert_array_equal(
+        x_loaded.numpy(), np.rint(eval_sir_model_batch(theta)).astype(np.int16)
+    )
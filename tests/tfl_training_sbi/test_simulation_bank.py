@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import torch
+from tfl_training_sbi.simulation_bank import ShardedSIRSimulation, SimulationBank
+from torch.utils.data import DataLoader
+
+
+def test_simulation_bank_appendAndReopen(tmp_path):
+    theta = np.random.rand(25, 2).astype(np.float32)
+    x = np.random.rand(25, 10).astype(np.float32)
+
+    bank = SimulationBank(str(tmp_path), shard_size=10)
+    bank.append(theta[:15], x[:15])
+    # float64 is cast to the storage dtype of the bank
+    bank.append(theta[15:].astype(np.float64), x[15:])
+    reopened = SimulationBank(str(tmp_path))
+
+    assert len(reopened) == 25
+    assert [shard["num_samples"] for shard in reopened.shards] == [10, 10, 5]
+    np.testing.assert_allclose(reopened.shards[1]["mean_x"], x[10:20].mean(axis=0))
+    np.testing.assert_array_equal(reopened.load()[1].numpy(), x)
+
+
+def test_simulation_bank_smallAppendsFillShards(tmp_path):
+    theta = np.random.rand(23, 2).astype(np.float32)
+    x = np.random.rand(23, 10).astype(np.float32)
+
+    bank = SimulationBank(str(tmp_path), shard_size=10)
+    for start in range(0, 23, 3):
+        bank.append(theta[start : start + 3], x[start : start + 3])
+
+    assert [shard["num_samples"] for shard in bank.shards] == [10, 10, 3]
+    assert len(os.listdir(tmp_path)) == 2 * 3 + 1
+    np.testing.assert_array_equal(bank.load()[0].numpy(), theta)
+
+
+def test_sharded_sir_simulation_workersCoverBankOnce(tmp_path):
+    theta = np.arange(40, dtype=np.float64).reshape(20, 2)
+    bank = SimulationBank(str(tmp_path), shard_size=3)
+    bank.append(theta, np.random.rand(20, 10))
+
+    dataset = ShardedSIRSimulation(bank, shuffle_buffer_size=4, seed=1)
+    loader = DataLoader(dataset, batch_size=5, num_workers=2)
+    thetas = torch.cat([batch["theta"][:, 0] for batch in loader])
+
+    assert thetas.shape == (20, 2)
+    assert sorted(thetas[:, 0].tolist()) == theta[:, 0].tolist()
+    assert thetas[:, 0].tolist() != theta[:, 0].tolist()
+    # buffered items are copies and do not keep their shard alive
+    assert all(item["theta"]._base is None for item in dataset)
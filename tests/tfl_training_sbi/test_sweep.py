@@ -0,0 +1,23 @@
+import pytest
+import torch
+from tfl_training_sbi.sweep import select_cheapest, sweep
+
+
+def test_sweep_tableAndSelection():
+    x = torch.rand(1_000, 1)
+    theta = torch.cat([x, -x], dim=1) + 0.1 * torch.randn(1_000, 2)
+    configs = [
+        {"num_components": 1, "hidden_features": [8]},
+        {"num_components": 2, "hidden_features": [16, 8]},
+    ]
+
+    results = sweep(configs, theta, x, num_workers=2, num_samples=10, max_epochs=2)
+    cheapest = select_cheapest(results, results["validation_log_prob"].min())
+
+    assert list(results["num_components"]) == [1, 2]
+    assert (results["train_seconds"] > 0).all()
+    assert (results["inference_latency_ms"] > 0).all()
+    assert cheapest["inference_latency_ms"] == results["inference_latency_ms"].min()
+    assert not theta.is_shared() and not x.is_shared()
+    with pytest.raises(ValueError):
+        select_cheapest(results, float("inf"))
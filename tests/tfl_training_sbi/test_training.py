@@ -0,0 +1,109 @@
+import torch
+import torch.nn as nn
+from tfl_training_sbi.data_utils import SIRSimulation
+from tfl_training_sbi.mdn import MultivariateGaussianMDN
+from tfl_training_sbi.training import fit, fit_distributed, unpack_batch
+from torch.utils.data import random_split
+
+
+def make_mdn() -> MultivariateGaussianMDN:
+    return MultivariateGaussianMDN(
+        features=2,
+        hidden_net=nn.Sequential(nn.Linear(1, 16), nn.ReLU()),
+        num_components=2,
+        hidden_features=16,
+    )
+
+
+def make_simulation() -> SIRSimulation:
+    x = torch.rand(2_000, 1)
+    theta = torch.cat([x, -x], dim=1) + 0.1 * torch.randn(2_000, 2)
+    return SIRSimulation(theta, x, simulator_lag=0.0)
+
+
+def test_fit_reducesValidationLossAndResumesFromCheckpoint(tmp_path):
+    torch.manual_seed(0)
+    simulation = make_simulation()
+    checkpoint_path = str(tmp_path / "checkpoint.pt")
+
+    mdn = make_mdn()
+    first = fit(
+        mdn, simulation, batch_size=256, max_epochs=3, checkpoint_path=checkpoint_path
+    )
+    resumed = fit(
+        mdn, simulation, batch_size=256, max_epochs=6, checkpoint_path=checkpoint_path
+    )
+
+    assert len(first["validation_loss"]) == 3
+    assert resumed["validation_loss"][:3] == first["validation_loss"]
+    assert len(resumed["validation_loss"]) == 6
+    assert resumed["validation_loss"][-1] < resumed["validation_loss"][0]
+    assert all(speed > 0 for speed in resumed["samples_per_second"])
+
+
+def test_fit_stopsEarlyAndRestoresNumThreads():
+    torch.manual_seed(0)
+    num_threads = torch.get_num_threads()
+
+    history = fit(
+        make_mdn(),
+        make_simulation(),
+        max_epochs=50,
+        learning_rate=0.0,
+        patience=2,
+        num_threads=num_threads + 1,
+    )
+
+    assert len(history["validation_loss"]) == 3
+    assert torch.get_num_threads() == num_threads
+
+
+def test_fit_distributed_updatesModelAndAggregatesHistory():
+    torch.manual_seed(0)
+    mdn = make_mdn()
+    before = [p.detach().clone() for p in mdn.parameters()]
+
+    history = fit_distributed(
+        mdn, make_simulation(), num_processes=2, batch_size=128, max_epochs=3
+    )
+
+    assert len(history["validation_loss"]) == 3
+    assert history["validation_loss"][-1] < history["validation_loss"][0]
+    assert any(not torch.equal(b, p) for b, p in zip(before, mdn.parameters()))
+
+
+def test_fit_distributed_validationLossCountsEverySampleOnce():
+    torch.manual_seed(0)
+    mdn, simulation = make_mdn(), make_simulation()
+    # 201 validation samples, which 2 processes cannot split evenly
+    _, validation_set = random_split(
+        simulation, [1_799, 201], generator=torch.Generator().manual_seed(0)
+    )
+    theta, x = unpack_batch(simulation[validation_set.indices])
+
+    history = fit_distributed(
+        mdn,
+        simulation,
+        num_processes=2,
+        max_epochs=1,
+        learning_rate=0.0,
+        validation_fraction=0.1006,
+    )
+
+    expected = -mdn.log_prob(theta, x).mean().item()
+    assert abs(history["validation_loss"][0] - expected) < 1e-5
+
+
+def test_fit_mixedPrecision():
+    torch.manual_seed(0)
+
+    history = fit(
+        make_mdn(),
+        make_simulation(),
+        batch_size=128,
+        max_epochs=3,
+        learning_rate=1e-2,
+        mixed_precision=True,
+    )
+
+    assert history["validation_loss"][-1] < history["validation_loss"][0]
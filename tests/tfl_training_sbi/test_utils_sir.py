@@ -0,0 +1,74 @@
+import numpy as np
+from tfl_training_sbi.simulation_cache import SimulationCache
+from tfl_training_sbi.utils_sir import (
+    ObservationSpec,
+    eval_sir_model,
+    eval_sir_model_batch,
+)
+
+
+def test_eval_sir_model_batch_matchesPerThetaSolve():
+    rng = np.random.default_rng(16)
+    theta = np.stack(
+        [rng.uniform(0.05, 2.5, size=20), rng.uniform(0.05, 0.25, size=20)], axis=1
+    )
+
+    expected = np.stack([eval_sir_model(theta_i) for theta_i in theta])
+    result = eval_sir_model_batch(theta)
+
+    assert result.shape == (20, 160, 3)
+    np.testing.assert_allclose(result, expected, atol=0.05)
+
+
+def test_eval_sir_model_batch_cacheHitsAndEviction(tmp_path):
+    theta = np.array([[0.4, 0.125], [1.5, 0.2], [0.1, 0.05]])
+    # room for exactly two results of shape (160, 3)
+    cache = SimulationCache(str(tmp_path), max_size_bytes=2 * (160 * 3 * 8 + 128))
+
+    first = eval_sir_model_batch(theta[:2], cache=cache)
+    second = eval_sir_model_batch(theta[:2], cache=cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+    np.testing.assert_array_equal(first, second)
+
+    eval_sir_model_batch(theta[1:], cache=cache)
+    assert len(cache) == 2
+    assert (
+        cache.get(
+            cache.key(theta[0], (999, 1, 0), 1_000, np.linspace(0, 160, 160), "rk4-10")
+        )
+        is None
+    )
+    np.testing.assert_allclose(
+        eval_sir_model(theta[2], cache=cache), eval_sir_model(theta[2]), rtol=1e-12
+    )
+
+
+def test_simulation_cache_key_separatesInputs():
+    grid_points = np.linspace(0, 160, 160)
+
+    assert SimulationCache.key([1, 2], (3, 4, 5), 6, grid_points) != (
+        SimulationCache.key([1, 2, 3], (4, 5), 6, grid_points)
+    )
+    assert SimulationCache.key([0.4, 0.125], (999, 1, 0), 1_000, grid_points) == (
+        SimulationCache.key(np.array([0.4, 0.125]), [999, 1, 0], 1_000, grid_points)
+    )
+
+
+def test_eval_sir_model_batch_observationSpecMatchesFullTrajectory():
+    theta = np.array([[0.4, 0.125], [1.5, 0.2]])
+    observation = ObservationSpec(compartments=1, time_indices=slice(None, None, 16))
+    aggregated = ObservationSpec(time_indices=[90, 3], aggregation="max")
+
+    np.testing.assert_array_equal(
+        eval_sir_model_batch(theta, observation=observation),
+        eval_sir_model_batch(theta)[:, ::16, 1],
+    )
+    np.testing.assert_array_equal(
+        eval_sir_model_batch(theta, observation=aggregated),
+        eval_sir_model_batch(theta)[:, [90, 3]].max(1),
+    )
+    np.testing.assert_allclose(
+        eval_sir_model(theta[0], observation=observation),
+        eval_sir_model(theta[0])[::16, 1],
+        atol=1e-4,
+    )
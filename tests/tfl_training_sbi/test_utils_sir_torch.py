@@ -0,0 +1,39 @@
+import numpy as np
+import torch
+from tfl_training_sbi.utils_sir import ObservationSpec, eval_sir_model_batch
+from tfl_training_sbi.utils_sir_torch import eval_sir_model_torch
+
+
+def test_eval_sir_model_torch_matchesNumpyBatch():
+    theta = torch.tensor([[0.4, 0.125], [1.5, 0.2], [0.1, 0.05]], dtype=torch.float64)
+
+    result = eval_sir_model_torch(theta)
+
+    assert result.shape == (3, 160, 3)
+    assert not result.requires_grad
+    np.testing.assert_allclose(
+        result.numpy(), eval_sir_model_batch(theta.numpy()), rtol=1e-10, atol=1e-8
+    )
+
+
+def test_eval_sir_model_torch_differentiable():
+    theta = torch.tensor([[0.4, 0.125]], dtype=torch.float64, requires_grad=True)
+
+    infected = eval_sir_model_torch(theta, differentiable=True)[:, ::16, 1]
+    infected.sum().backward()
+
+    assert theta.grad is not None
+    assert torch.isfinite(theta.grad).all()
+
+
+def test_eval_sir_model_torch_observationSpec():
+    theta = torch.tensor([[0.4, 0.125], [1.5, 0.2]], dtype=torch.float64)
+    observation = ObservationSpec(
+        compartments=[1, 2], time_indices=[50, 10], aggregation="max"
+    )
+
+    np.testing.assert_allclose(
+        eval_sir_model_torch(theta, observation=observation).numpy(),
+        eval_sir_model_batch(theta.numpy(), observation=observation),
+        rtol=1e-10,
+    )